@@ -0,0 +1,437 @@
+# Precomputed analytics for organisations
+# Summary tables are kept up to date by triggers, so the insights page only reads a handful of rows
+# no matter how many events, requests or attendees there have ever been
+from datetime import date
+
+import click
+from flask import render_template, redirect, url_for, flash
+
+from models import app, connect_db, get_read_db, init_db
+from principal import current_principal
+
+
+# Summary tables
+ANALYTICS_TABLES = [
+    # One row per event: attendees, sum of their birth dates (For the average age) and request counts
+    '''
+    CREATE TABLE IF NOT EXISTS event_stats (
+        event_id INTEGER PRIMARY KEY,
+        organisation_id INTEGER NOT NULL,
+        max_volunteers INTEGER,
+        attendee_count INTEGER NOT NULL DEFAULT 0,
+        dob_julian_sum REAL NOT NULL DEFAULT 0, -- Sum of julianday(dob) of attendees, average age = now - sum / dob_count
+        dob_count INTEGER NOT NULL DEFAULT 0, -- Attendees in that sum (A birth date SQLite can't read is left out of both)
+        request_count INTEGER NOT NULL DEFAULT 0,
+        accepted_count INTEGER NOT NULL DEFAULT 0,
+        declined_count INTEGER NOT NULL DEFAULT 0
+    );''',
+    # One row per organisation, totals across all of its events
+    '''
+    CREATE TABLE IF NOT EXISTS organisation_stats (
+        organisation_id INTEGER PRIMARY KEY,
+        event_count INTEGER NOT NULL DEFAULT 0,
+        capacity_total INTEGER NOT NULL DEFAULT 0,
+        attendee_count INTEGER NOT NULL DEFAULT 0,
+        request_count INTEGER NOT NULL DEFAULT 0,
+        accepted_count INTEGER NOT NULL DEFAULT 0,
+        declined_count INTEGER NOT NULL DEFAULT 0
+    );''',
+    # Attendees of an organisation's events by birth year (Ages are worked out when read, so rows never go stale)
+    '''
+    CREATE TABLE IF NOT EXISTS organisation_age_stats (
+        organisation_id INTEGER NOT NULL,
+        birth_year INTEGER NOT NULL,
+        attendee_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (organisation_id, birth_year)
+    );''',
+    # How many of an organisation's events need each skill
+    '''
+    CREATE TABLE IF NOT EXISTS organisation_skill_demand (
+        organisation_id INTEGER NOT NULL,
+        skill_id INTEGER NOT NULL,
+        event_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (organisation_id, skill_id)
+    );''',
+    # How many volunteers have each skill
+    '''
+    CREATE TABLE IF NOT EXISTS skill_supply (
+        skill_id INTEGER PRIMARY KEY,
+        volunteer_count INTEGER NOT NULL DEFAULT 0
+    );''',
+]
+
+
+# Triggers that keep the summary tables in step with the real tables
+# Child delete triggers only run while the event still exists, deleting an event takes its whole contribution off at once
+# None of the delete triggers run while the 'archiving' flag is set, as archived events still count
+ANALYTICS_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS analytics_event_insert AFTER INSERT ON event
+    BEGIN
+        INSERT INTO event_stats (event_id, organisation_id, max_volunteers)
+        VALUES (NEW.event_id, NEW.organisation_id, NEW.max_volunteers);
+
+        INSERT INTO organisation_stats (organisation_id, event_count, capacity_total)
+        VALUES (NEW.organisation_id, 1, COALESCE(NEW.max_volunteers, 0))
+        ON CONFLICT (organisation_id) DO UPDATE SET
+            event_count = event_count + 1,
+            capacity_total = capacity_total + excluded.capacity_total;
+    END;''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS analytics_event_capacity AFTER UPDATE OF max_volunteers ON event
+    BEGIN
+        UPDATE event_stats SET max_volunteers = NEW.max_volunteers WHERE event_id = NEW.event_id;
+
+        UPDATE organisation_stats
+        SET capacity_total = capacity_total - COALESCE(OLD.max_volunteers, 0) + COALESCE(NEW.max_volunteers, 0)
+        WHERE organisation_id = NEW.organisation_id;
+    END;''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS analytics_event_delete BEFORE DELETE ON event
+    WHEN NOT EXISTS (SELECT 1 FROM maintenance_flag WHERE name = 'archiving')
+    BEGIN
+        UPDATE organisation_stats
+        SET event_count = event_count - 1,
+            capacity_total = capacity_total - COALESCE(OLD.max_volunteers, 0),
+            attendee_count = organisation_stats.attendee_count - s.attendee_count,
+            request_count = organisation_stats.request_count - s.request_count,
+            accepted_count = organisation_stats.accepted_count - s.accepted_count,
+            declined_count = organisation_stats.declined_count - s.declined_count
+        FROM (SELECT * FROM event_stats WHERE event_id = OLD.event_id) AS s
+        WHERE organisation_stats.organisation_id = OLD.organisation_id;
+
+        UPDATE organisation_age_stats
+        SET attendee_count = organisation_age_stats.attendee_count - a.n
+        FROM (
+            SELECT CAST(strftime('%Y', v.dob) AS INTEGER) AS birth_year, COUNT(*) AS n
+            FROM volunteer_event ve
+            JOIN volunteer v ON ve.volunteer_id = v.volunteer_id
+            WHERE ve.event_id = OLD.event_id AND julianday(v.dob) IS NOT NULL
+            GROUP BY 1
+        ) AS a
+        WHERE organisation_age_stats.organisation_id = OLD.organisation_id
+          AND organisation_age_stats.birth_year = a.birth_year;
+
+        UPDATE organisation_skill_demand
+        SET event_count = event_count - 1
+        WHERE organisation_id = OLD.organisation_id
+          AND skill_id IN (SELECT skill_id FROM event_skill WHERE event_id = OLD.event_id);
+
+        DELETE FROM event_stats WHERE event_id = OLD.event_id;
+    END;''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS analytics_attendee_insert AFTER INSERT ON volunteer_event
+    BEGIN
+        UPDATE event_stats
+        SET attendee_count = attendee_count + 1,
+            dob_julian_sum = dob_julian_sum + COALESCE(d.julian, 0),
+            dob_count = dob_count + (d.julian IS NOT NULL)
+        FROM (SELECT (SELECT julianday(dob) FROM volunteer WHERE volunteer_id = NEW.volunteer_id) AS julian) AS d
+        WHERE event_id = NEW.event_id;
+
+        UPDATE organisation_stats
+        SET attendee_count = attendee_count + 1
+        WHERE organisation_id = (SELECT organisation_id FROM event WHERE event_id = NEW.event_id);
+
+        INSERT INTO organisation_age_stats (organisation_id, birth_year, attendee_count)
+        SELECT e.organisation_id, CAST(strftime('%Y', v.dob) AS INTEGER), 1
+        FROM event e, volunteer v
+        WHERE e.event_id = NEW.event_id AND v.volunteer_id = NEW.volunteer_id AND julianday(v.dob) IS NOT NULL
+        ON CONFLICT (organisation_id, birth_year) DO UPDATE SET attendee_count = attendee_count + 1;
+    END;''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS analytics_attendee_delete AFTER DELETE ON volunteer_event
+    WHEN EXISTS (SELECT 1 FROM event WHERE event_id = OLD.event_id)
+     AND NOT EXISTS (SELECT 1 FROM maintenance_flag WHERE name = 'archiving')
+    BEGIN
+        UPDATE event_stats
+        SET attendee_count = attendee_count - 1,
+            dob_julian_sum = dob_julian_sum - COALESCE(d.julian, 0),
+            dob_count = dob_count - (d.julian IS NOT NULL)
+        FROM (SELECT (SELECT julianday(dob) FROM volunteer WHERE volunteer_id = OLD.volunteer_id) AS julian) AS d
+        WHERE event_id = OLD.event_id;
+
+        UPDATE organisation_stats
+        SET attendee_count = attendee_count - 1
+        WHERE organisation_id = (SELECT organisation_id FROM event WHERE event_id = OLD.event_id);
+
+        UPDATE organisation_age_stats
+        SET attendee_count = attendee_count - 1
+        WHERE organisation_id = (SELECT organisation_id FROM event WHERE event_id = OLD.event_id)
+          AND birth_year = (SELECT CAST(strftime('%Y', dob) AS INTEGER) FROM volunteer WHERE volunteer_id = OLD.volunteer_id);
+    END;''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS analytics_request_insert AFTER INSERT ON event_request
+    BEGIN
+        UPDATE event_stats
+        SET request_count = request_count + 1,
+            accepted_count = accepted_count + (NEW.status = 'accepted'),
+            declined_count = declined_count + (NEW.status = 'declined')
+        WHERE event_id = NEW.event_id;
+
+        UPDATE organisation_stats
+        SET request_count = request_count + 1,
+            accepted_count = accepted_count + (NEW.status = 'accepted'),
+            declined_count = declined_count + (NEW.status = 'declined')
+        WHERE organisation_id = (SELECT organisation_id FROM event WHERE event_id = NEW.event_id);
+    END;''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS analytics_request_status AFTER UPDATE OF status ON event_request
+    BEGIN
+        UPDATE event_stats
+        SET accepted_count = accepted_count + (NEW.status = 'accepted') - (OLD.status = 'accepted'),
+            declined_count = declined_count + (NEW.status = 'declined') - (OLD.status = 'declined')
+        WHERE event_id = NEW.event_id;
+
+        UPDATE organisation_stats
+        SET accepted_count = accepted_count + (NEW.status = 'accepted') - (OLD.status = 'accepted'),
+            declined_count = declined_count + (NEW.status = 'declined') - (OLD.status = 'declined')
+        WHERE organisation_id = (SELECT organisation_id FROM event WHERE event_id = NEW.event_id);
+    END;''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS analytics_request_delete AFTER DELETE ON event_request
+    WHEN EXISTS (SELECT 1 FROM event WHERE event_id = OLD.event_id)
+     AND NOT EXISTS (SELECT 1 FROM maintenance_flag WHERE name = 'archiving')
+    BEGIN
+        UPDATE event_stats
+        SET request_count = request_count - 1,
+            accepted_count = accepted_count - (OLD.status = 'accepted'),
+            declined_count = declined_count - (OLD.status = 'declined')
+        WHERE event_id = OLD.event_id;
+
+        UPDATE organisation_stats
+        SET request_count = request_count - 1,
+            accepted_count = accepted_count - (OLD.status = 'accepted'),
+            declined_count = declined_count - (OLD.status = 'declined')
+        WHERE organisation_id = (SELECT organisation_id FROM event WHERE event_id = OLD.event_id);
+    END;''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS analytics_volunteer_skill_insert AFTER INSERT ON volunteer_skill
+    BEGIN
+        INSERT INTO skill_supply (skill_id, volunteer_count) VALUES (NEW.skill_id, 1)
+        ON CONFLICT (skill_id) DO UPDATE SET volunteer_count = volunteer_count + 1;
+    END;''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS analytics_volunteer_skill_delete AFTER DELETE ON volunteer_skill
+    BEGIN
+        UPDATE skill_supply SET volunteer_count = volunteer_count - 1 WHERE skill_id = OLD.skill_id;
+    END;''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS analytics_event_skill_insert AFTER INSERT ON event_skill
+    BEGIN
+        INSERT INTO organisation_skill_demand (organisation_id, skill_id, event_count)
+        SELECT organisation_id, NEW.skill_id, 1 FROM event WHERE event_id = NEW.event_id
+        ON CONFLICT (organisation_id, skill_id) DO UPDATE SET event_count = event_count + 1;
+    END;''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS analytics_event_skill_delete AFTER DELETE ON event_skill
+    WHEN EXISTS (SELECT 1 FROM event WHERE event_id = OLD.event_id)
+     AND NOT EXISTS (SELECT 1 FROM maintenance_flag WHERE name = 'archiving')
+    BEGIN
+        UPDATE organisation_skill_demand
+        SET event_count = event_count - 1
+        WHERE organisation_id = (SELECT organisation_id FROM event WHERE event_id = OLD.event_id)
+          AND skill_id = OLD.skill_id;
+    END;''',
+]
+
+
+# What each summary table should contain, worked out from scratch (Used by the rebuild and the consistency check)
+# Reads the all_* views, so archived events still count
+# table -> (columns, query for the expected rows, column that must be non-zero for a stored row to count)
+FULL_QUERIES = {
+    "event_stats": (
+        "event_id, organisation_id, max_volunteers, attendee_count, dob_julian_sum, dob_count, request_count, accepted_count, declined_count",
+        '''
+        SELECT e.event_id, e.organisation_id, e.max_volunteers,
+               (SELECT COUNT(*) FROM all_volunteer_event ve WHERE ve.event_id = e.event_id),
+               (SELECT COALESCE(SUM(julianday(v.dob)), 0) FROM all_volunteer_event ve JOIN volunteer v ON ve.volunteer_id = v.volunteer_id WHERE ve.event_id = e.event_id),
+               (SELECT COUNT(julianday(v.dob)) FROM all_volunteer_event ve JOIN volunteer v ON ve.volunteer_id = v.volunteer_id WHERE ve.event_id = e.event_id),
+               (SELECT COUNT(*) FROM all_event_request er WHERE er.event_id = e.event_id),
+               (SELECT COUNT(*) FROM all_event_request er WHERE er.event_id = e.event_id AND er.status = 'accepted'),
+               (SELECT COUNT(*) FROM all_event_request er WHERE er.event_id = e.event_id AND er.status = 'declined')
+        FROM all_event e''',
+        None,
+    ),
+    "organisation_stats": (
+        "organisation_id, event_count, capacity_total, attendee_count, request_count, accepted_count, declined_count",
+        '''
+        SELECT e.organisation_id, COUNT(*), SUM(COALESCE(e.max_volunteers, 0)),
+               SUM((SELECT COUNT(*) FROM all_volunteer_event ve WHERE ve.event_id = e.event_id)),
+               SUM((SELECT COUNT(*) FROM all_event_request er WHERE er.event_id = e.event_id)),
+               SUM((SELECT COUNT(*) FROM all_event_request er WHERE er.event_id = e.event_id AND er.status = 'accepted')),
+               SUM((SELECT COUNT(*) FROM all_event_request er WHERE er.event_id = e.event_id AND er.status = 'declined'))
+        FROM all_event e
+        GROUP BY e.organisation_id''',
+        "event_count",
+    ),
+    "organisation_age_stats": (
+        "organisation_id, birth_year, attendee_count",
+        '''
+        SELECT e.organisation_id, CAST(strftime('%Y', v.dob) AS INTEGER), COUNT(*)
+        FROM all_volunteer_event ve
+        JOIN all_event e ON ve.event_id = e.event_id
+        JOIN volunteer v ON ve.volunteer_id = v.volunteer_id
+        WHERE julianday(v.dob) IS NOT NULL
+        GROUP BY 1, 2''',
+        "attendee_count",
+    ),
+    "organisation_skill_demand": (
+        "organisation_id, skill_id, event_count",
+        '''
+        SELECT e.organisation_id, es.skill_id, COUNT(*)
+        FROM all_event_skill es
+        JOIN all_event e ON es.event_id = e.event_id
+        GROUP BY 1, 2''',
+        "event_count",
+    ),
+    "skill_supply": (
+        "skill_id, volunteer_count",
+        '''
+        SELECT skill_id, COUNT(*)
+        FROM volunteer_skill
+        GROUP BY skill_id''',
+        "volunteer_count",
+    ),
+}
+
+
+# Create the summary tables and triggers, filling them from scratch the first time
+def init_analytics(conn):
+    cursor = conn.cursor()
+    rebuild = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'event_stats'").fetchone() is None # New database
+
+    for sql in ANALYTICS_TABLES:
+        cursor.execute(sql)
+
+    # Databases from before dob_count get the column, and a rebuild to fill it (And drop unreadable birth dates from the sums)
+    if not rebuild and "dob_count" not in [row[1] for row in cursor.execute("PRAGMA table_info(event_stats)")]:
+        cursor.execute("ALTER TABLE event_stats ADD COLUMN dob_count INTEGER NOT NULL DEFAULT 0")
+        rebuild = True
+
+    # Recreate the triggers every time, so changes to them reach existing databases
+    for sql in ANALYTICS_TRIGGERS:
+        name = sql.split("EXISTS", 1)[1].split()[0]
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(sql)
+
+    if rebuild:
+        rebuild_analytics(conn)
+
+
+# Throw away every summary row and recompute them all from the real tables
+def rebuild_analytics(conn):
+    cursor = conn.cursor()
+    for table, (columns, query, _) in FULL_QUERIES.items():
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"INSERT INTO {table} ({columns}) {query}")
+
+
+# Compare the stored summary rows with freshly computed ones, returns {table: number of rows that differ}
+def check_analytics(conn):
+    cursor = conn.cursor()
+    mismatches = {}
+
+    for table, (columns, query, nonzero) in FULL_QUERIES.items():
+        # Rows that were counted down to zero are the same as missing rows
+        stored = f"SELECT {columns} FROM {table}" + (f" WHERE {nonzero} <> 0" if nonzero else "")
+
+        # Round the birth date sums, as adding and subtracting floats in a different order isn't exact
+        rounded = ", ".join(f"ROUND({c}, 3)" if c == "dob_julian_sum" else c for c in columns.split(", "))
+        cursor.execute(f'''
+            WITH stored AS ({stored}), expected ({columns}) AS ({query})
+            SELECT COUNT(*) FROM (
+                SELECT * FROM (SELECT {rounded} FROM stored EXCEPT SELECT {rounded} FROM expected)
+                UNION ALL
+                SELECT * FROM (SELECT {rounded} FROM expected EXCEPT SELECT {rounded} FROM stored)
+            )''')
+        count = cursor.fetchone()[0]
+        if count:
+            mismatches[table] = count
+
+    return mismatches
+
+
+# Age buckets shown on the insights page (Lower bound, upper bound, label)
+AGE_BUCKETS = [(0, 17, "Under 18"), (18, 24, "18-24"), (25, 34, "25-34"), (35, 44, "35-44"),
+               (45, 54, "45-54"), (55, 64, "55-64"), (65, 200, "65+")]
+
+
+# Route for organisations to see how their events are going
+@app.route('/insights')
+def insights():
+
+    # Only organisations have events to report on
+    principal = current_principal()
+    if not principal or not principal.is_organisation:
+        flash("Only organisations can view insights.", "danger") # Throw error message
+        return redirect(url_for('index')) # Redirect user back to home page
+
+    # Pythonic way of initialising cursor object
+    with get_read_db() as conn:
+        cursor = conn.cursor()
+
+        # Totals across all of the organisation's events (One row)
+        cursor.execute("SELECT * FROM organisation_stats WHERE organisation_id = ?", (principal.organisation_id,))
+        totals = cursor.fetchone()
+
+        # Skills the organisation needs next to how many volunteers have them
+        cursor.execute("""
+            SELECT s.name, d.event_count AS demand, COALESCE(sp.volunteer_count, 0) AS supply
+            FROM organisation_skill_demand d
+            JOIN skill s ON d.skill_id = s.skill_id
+            LEFT JOIN skill_supply sp ON d.skill_id = sp.skill_id
+            WHERE d.organisation_id = ? AND d.event_count > 0
+            ORDER BY d.event_count DESC, s.name""", (principal.organisation_id,))
+        skills = cursor.fetchall()
+
+        # Attendees by birth year, at most one row per year
+        cursor.execute("""
+            SELECT birth_year, attendee_count
+            FROM organisation_age_stats
+            WHERE organisation_id = ? AND attendee_count > 0""", (principal.organisation_id,))
+        birth_years = cursor.fetchall()
+
+    # Turn birth years into age buckets (Age as of this year, so can be a year out before birthdays)
+    this_year = date.today().year
+    ages = {label: 0 for _, _, label in AGE_BUCKETS}
+    for row in birth_years:
+        age = this_year - row['birth_year']
+        for low, high, label in AGE_BUCKETS:
+            if low <= age <= high:
+                ages[label] += row['attendee_count']
+                break
+
+    # Rates, if there's anything to divide by
+    fill_rate = acceptance_rate = None
+    if totals and totals['capacity_total']:
+        fill_rate = round(100 * totals['attendee_count'] / totals['capacity_total'], 1)
+    if totals and totals['accepted_count'] + totals['declined_count']:
+        acceptance_rate = round(100 * totals['accepted_count'] / (totals['accepted_count'] + totals['declined_count']), 1)
+
+    # Render the actual insights HTML page
+    return render_template("insights.html",
+                           totals=totals,
+                           fill_rate=fill_rate,
+                           acceptance_rate=acceptance_rate,
+                           skills=skills,
+                           ages=ages)
+
+
+# Command to rebuild the summary tables, or just check them: 'flask --app app rebuild-analytics [--check]'
+@app.cli.command("rebuild-analytics")
+@click.option("--check", is_flag=True, help="Only report rows that don't match, don't rebuild.")
+def rebuild_analytics_command(check):
+    init_db() # Make sure the tables exist on a database that hasn't been started yet
+    conn = connect_db()
+    with conn:
+        mismatches = check_analytics(conn)
+        for table, count in mismatches.items():
+            click.echo(f"{table}: {count} rows differ")
+        if not mismatches:
+            click.echo("Analytics tables are consistent.")
+
+        if not check:
+            rebuild_analytics(conn)
+            click.echo("Analytics tables rebuilt.")
+    conn.close()
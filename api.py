@@ -0,0 +1,234 @@
+# Versioned JSON API: /api/v1/events, /api/v1/organisations and /api/v1/volunteers
+# Same data and access rules as the HTML pages, for mobile clients and integrations. Supports picking fields
+# (?fields=title,event_date), cursor pagination (?limit=50&cursor=...), batch lookups (?ids=1,2,3) and gzip/brotli.
+# SQLite builds each row's JSON itself (json_object), so responses are joined straight from the cursor rows
+import base64
+import binascii
+import gzip
+import json
+
+from flask import Response, request
+
+from models import app, get_read_db
+from principal import current_principal
+
+# Brotli is optional, gzip is used when it isn't installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+API_PREFIX = "/api/v1"
+DEFAULT_LIMIT = 50 # Rows per page
+MAX_LIMIT = 200
+MAX_IDS = 100 # Ids per batch lookup
+COMPRESS_MIN_BYTES = 1024 # Smaller responses aren't worth compressing
+MAX_ID = 2 ** 63 - 1 # SQLite integers are signed 64-bit, anything bigger can't be looked up
+
+
+# What each resource can return: field name -> SQL expression
+# Fields are only selected when asked for, so skipping 'description' or 'skills' skips their work too
+RESOURCES = {
+    "events": {
+        "id": "e.event_id",
+        "from": """
+            FROM event e
+            INNER JOIN organisation o ON e.organisation_id = o.organisation_id
+            LEFT JOIN event_stats st ON e.event_id = st.event_id""",
+        "fields": {
+            "event_id": "e.event_id",
+            "title": "e.title",
+            "description": "e.description",
+            "event_date": "e.event_date",
+            "location": "e.location",
+            "max_volunteers": "e.max_volunteers",
+            "organisation_id": "e.organisation_id",
+            "organisation": "o.name",
+            "volunteer_count": "COALESCE(st.attendee_count, 0)", # Kept up to date by the analytics triggers
+            "skills": "json((SELECT json_group_array(s.name) FROM event_skill es JOIN skill s ON es.skill_id = s.skill_id WHERE es.event_id = e.event_id))",
+            "skill_ids": "json((SELECT json_group_array(es.skill_id) FROM event_skill es WHERE es.event_id = e.event_id))",
+        },
+        "roles": ("volunteer", "organisation"),
+    },
+    "organisations": {
+        "id": "o.organisation_id",
+        "from": "FROM organisation o",
+        "fields": {
+            "organisation_id": "o.organisation_id",
+            "name": "o.name",
+            "description": "o.description",
+            "address": "o.address",
+            "website_url": "o.website_url",
+        },
+        "roles": ("volunteer",), # Same as the organisations page
+    },
+    "volunteers": {
+        "id": "v.volunteer_id",
+        "from": "FROM volunteer v INNER JOIN user u ON v.user_id = u.user_id",
+        "fields": {
+            "volunteer_id": "v.volunteer_id",
+            "first_name": "v.first_name",
+            "last_name": "v.last_name",
+            "age": "CAST((julianday('now') - julianday(v.dob)) / 365 AS INT)",
+            "email": "u.email",
+            "skills": "json((SELECT json_group_array(s.name) FROM volunteer_skill vs JOIN skill s ON vs.skill_id = s.skill_id WHERE vs.volunteer_id = v.volunteer_id))",
+            "skill_ids": "json((SELECT json_group_array(vs.skill_id) FROM volunteer_skill vs WHERE vs.volunteer_id = v.volunteer_id))",
+        },
+        "roles": ("organisation",), # Same as the volunteers page
+    },
+}
+
+
+# Raised for bad query parameters, turned into a 400
+class BadRequest(ValueError):
+    pass
+
+
+# Send a JSON body, compressed if the client accepts it and it's big enough to be worth it
+def json_response(body, status=200):
+    data = body.encode()
+    headers = {"Content-Type": "application/json", "Vary": "Accept-Encoding"}
+
+    if len(data) >= COMPRESS_MIN_BYTES:
+        if brotli is not None and request.accept_encodings["br"]:
+            data = brotli.compress(data, quality=5)
+            headers["Content-Encoding"] = "br"
+        elif request.accept_encodings["gzip"]:
+            data = gzip.compress(data, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+
+    return Response(data, status, headers)
+
+
+def error_response(message, status):
+    return json_response(json.dumps({"error": message}), status)
+
+
+# A whole number SQLite can store, or BadRequest
+def parse_id(value, message):
+    try:
+        number = int(value)
+    except ValueError:
+        raise BadRequest(message)
+    if not -MAX_ID - 1 <= number <= MAX_ID:
+        raise BadRequest(message)
+    return number
+
+
+# Cursors are the last id of the previous page, base64'd so clients treat them as opaque
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        value = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise BadRequest("Invalid cursor.")
+    return parse_id(value, "Invalid cursor.")
+
+
+# Comma separated list from the query string, e.g. '?ids=1,2,3'
+def split_param(name):
+    value = request.args.get(name, "")
+    return [part.strip() for part in value.split(",") if part.strip()]
+
+
+# The json_object(...) expression for the requested fields (All of them if none asked for)
+def select_fields(resource):
+    fields = resource["fields"]
+    wanted = split_param("fields") or list(fields)
+
+    unknown = [f for f in wanted if f not in fields]
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(fields)}.")
+
+    return "json_object(" + ", ".join(f"'{f}', {fields[f]}" for f in dict.fromkeys(wanted)) + ")"
+
+
+# Build and run the query for a list or batch request, returns the response body
+def list_resource(resource, filters=(), params=()):
+    selected = select_fields(resource)
+    where, args = list(filters), list(params)
+    id_column = resource["id"]
+
+    ids = split_param("ids")
+    if ids:
+        # Batch lookup: exactly these rows, in id order, no paging
+        ids = [parse_id(i, "ids must be whole numbers.") for i in ids]
+        if len(ids) > MAX_IDS:
+            raise BadRequest(f"At most {MAX_IDS} ids per request.")
+
+        where.append(f"{id_column} IN ({','.join('?' * len(ids))})")
+        args += ids
+        limit = len(ids)
+    else:
+        try:
+            limit = int(request.args.get("limit", DEFAULT_LIMIT))
+        except ValueError:
+            raise BadRequest("limit must be a whole number.")
+        limit = max(1, min(limit, MAX_LIMIT))
+
+        # Keyset pagination: carry on after the last id of the previous page (Uses the primary key, never OFFSET)
+        cursor_param = request.args.get("cursor")
+        if cursor_param:
+            where.append(f"{id_column} > ?")
+            args.append(decode_cursor(cursor_param))
+
+    sql = f"SELECT {selected}, {id_column} {resource['from']}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {id_column} LIMIT ?"
+    args.append(limit + 1) # One extra row tells us if there's another page
+
+    with get_read_db() as conn:
+        rows = conn.execute(sql, args).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if not ids:
+            next_cursor = encode_cursor(rows[-1][1])
+
+    # Rows are already JSON, so just join them together
+    return '{"data":[' + ",".join(row[0] for row in rows) + '],"next_cursor":' + json.dumps(next_cursor) + "}"
+
+
+# Shared handling for the three resources: log in check, role check, bad parameters
+def serve(name, filters=(), params=()):
+    resource = RESOURCES[name]
+
+    principal = current_principal()
+    if not principal:
+        return error_response("Log in first.", 401)
+    if principal.role not in resource["roles"]:
+        return error_response("Access denied.", 403)
+
+    try:
+        return json_response(list_resource(resource, filters, params))
+    except BadRequest as e:
+        return error_response(str(e), 400)
+
+
+@app.route(f"{API_PREFIX}/events")
+def api_events():
+    return serve("events")
+
+
+@app.route(f"{API_PREFIX}/organisations")
+def api_organisations():
+    return serve("organisations")
+
+
+# Volunteers can be filtered by skill like on the volunteers page, e.g. '?skill_id=3'
+@app.route(f"{API_PREFIX}/volunteers")
+def api_volunteers():
+    skill_id = request.args.get("skill_id")
+    if not skill_id:
+        return serve("volunteers")
+    try:
+        skill_id = parse_id(skill_id, "skill_id must be a whole number.")
+    except BadRequest as e:
+        return error_response(str(e), 400)
+    return serve("volunteers",
+                 ["v.volunteer_id IN (SELECT volunteer_id FROM volunteer_skill WHERE skill_id = ?)"], [skill_id])
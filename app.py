@@ -1,13 +1,25 @@
 # app.py
 import sqlite3
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 import re
 from sqlite3 import IntegrityError
 
 from models import *
+from principal import current_principal, start_session, end_session, revoke_user_sessions
+import analytics # Registers the /insights route and the 'rebuild-analytics' command
+import matching # Registers the 'match-volunteers' command
+import archive # Registers the 'archive-events' command
+import backup # Registers the 'backup-db' and 'restore-db' commands
+import ratelimit # Throttles login, register and join_event before any other hook runs
+import api # Registers the /api/v1 JSON routes
+import assets # Registers asset_url() for templates, the /assets route and the 'build-assets' command
+from skills import set_volunteer_skills, set_event_skills, SkillError
+
+# Create any missing tables as soon as the app is loaded, so 'flask --app app run', WSGI servers and 'python app.py' all get them
+init_db()
 
 # ------------------- ROUTES ---------------------
 
@@ -31,6 +43,8 @@ def register():
             flash("Email and password are required.", "danger")
             return redirect(url_for('register')) # Reload to display flash
 
+        password_hash = generate_password_hash(password) # Hash before taking the writer, hashing is slow and would hold up every other write
+
         # Pythonic way of initialising cursor
         with get_db() as conn:
             cursor = conn.cursor()
@@ -39,7 +53,7 @@ def register():
             try:
                 # Insert the general details of user into the table
                 cursor.execute("INSERT INTO user (email, password_hash, role) VALUES (?, ?, ?)",
-                        (email, generate_password_hash(password), role))
+                        (email, password_hash, role))
                 user_id = cursor.lastrowid # Get user id, as the new user is the last user record entered
 
 
@@ -103,23 +117,27 @@ def login():
 
         # Try to find user from database
         # Pythonic way of initialising cursor object
-        with get_db() as conn:
+        with get_read_db() as conn:
             cursor = conn.cursor()
 
-            cursor.execute('SELECT user_id, role, password_hash FROM user WHERE email = ?', (email,)) # Get the user_id, user's role and their password
+            # Get the user_id, user's role and their password, plus their volunteer/organisation id so it's only looked up once
+            cursor.execute('''
+                SELECT u.user_id, u.role, u.password_hash, v.volunteer_id, o.organisation_id
+                FROM user u
+                LEFT JOIN volunteer v ON v.user_id = u.user_id
+                LEFT JOIN organisation o ON o.user_id = u.user_id
+                WHERE u.email = ?''', (email,))
             user = cursor.fetchone() # Fetch the next available row
 
         # If the user row is correct, and the password is correct, update the session to log user in
         if user and check_password_hash(user['password_hash'], password):
-            # Update session
-            session['loggedin'] = True
-            session['user_id'] = user['user_id']
-            session["role"] = user["role"]
+            start_session(user) # Server-side session, caches the user's role and ids
 
             return redirect(url_for('index')) # Redirect user back to home page
         
         # If wrong details
         else:
+            ratelimit.record_failure() # Only failed attempts count towards the per-account login limit
             flash('Invalid email or password. Please try again.', 'danger') # Can't find user, send warning message
     
     return render_template('login.html') # Render template
@@ -128,7 +146,7 @@ def login():
 # Route for user to logout
 @app.route('/logout')
 def logout():
-    session.clear() # Clear the session, so user no longer logged in
+    end_session() # Revoke the server-side session and clear the cookie, so user no longer logged in
     flash('You have been logged out.', 'info') # Send logged out message
 
     return redirect(url_for('index')) # Redirect user back to home page
@@ -138,7 +156,8 @@ def logout():
 @app.route("/volunteers")
 def all_volunteers():
     # If user is not an organisation account, then can't see volunteers page
-    if session.get("role") != "organisation":
+    principal = current_principal()
+    if not principal or principal.role != "organisation":
         flash("Access denied.", "danger") # Throw error message
         return redirect(url_for("index")) # Redirect user back to home page
 
@@ -147,7 +166,7 @@ def all_volunteers():
     skill_filter = request.args.get("skill_id")
 
     # Pythonic way of initialising cursor object (For running queries)
-    with get_db() as conn:
+    with get_read_db() as conn:
         cursor = conn.cursor()
 
         # If a skill filter is applied, only want to show volunteers with that skill
@@ -186,7 +205,8 @@ def all_volunteers():
 def all_organisations():
 
     # If user is not an volunteer account, then can't see organisations page
-    if session.get("role") != "volunteer":
+    principal = current_principal()
+    if not principal or not principal.is_volunteer:
         flash("Access denied.", "danger") # Throw error message
         return redirect(url_for("index")) # Redirect user back to home page
 
@@ -195,41 +215,30 @@ def all_organisations():
     filter_type = request.args.get('filter')
 
     # Pythonic way of initialising cursor object
-    with get_db() as conn:
+    with get_read_db() as conn:
         cursor = conn.cursor()
 
         # If filter set to 'Matching MySkills', need to first get the users skills, then show only orgs who look for those skills
         if filter_type == 'skills':
-            cursor.execute("SELECT volunteer_id FROM volunteer WHERE user_id = ?", (session['user_id'],)) # Get the id of the volunteer
-            v = cursor.fetchone() # Fetch next available row
-
-            # If user does exist,
-            if v:
-                volunteer_id = v['volunteer_id'] # Save volunteer to variable
-
-                # Get volunteer skills
-                cursor.execute("SELECT skill_id FROM volunteer_skill WHERE volunteer_id = ?", (volunteer_id,)) # Get all the id's of the skills the volunteer possesses
-                skill_ids = [row['skill_id'] for row in cursor.fetchall()] # Save all of the skill_ids to a list using list comprehension
-
-                # If there are any skills the user has
-                if skill_ids:
-                    placeholders = ",".join("?" * len(skill_ids)) # Placeholders for skills, as don't know how many skills user has (Is also a secret safety against SQL injection)
-
-                    # Find alll organisations that have events that require the skills the volunteer has (At least one overlap)
-                    cursor.execute(f"""
-                        SELECT DISTINCT o.organisation_id, o.name, o.description, o.address
-                        FROM organisation o
-                        INNER JOIN event e ON o.organisation_id = e.organisation_id
-                        INNER JOIN event_skill es ON e.event_id = es.event_id
-                        WHERE es.skill_id IN ({placeholders})""", skill_ids)
-
-                    organisations = cursor.fetchall() # Retrieve all matching organisations into list of dictionaries
-                
-                # If volunteer has no skills, no organisations to match, so return empty list for HTML template message
-                else:
-                    organisations = []
-            
-            # If no volunteer record for user, also return empty list for HTML template message, as no user to have skills?
+            # Get volunteer skills (volunteer_id already known from the session)
+            cursor.execute("SELECT skill_id FROM volunteer_skill WHERE volunteer_id = ?", (principal.volunteer_id,)) # Get all the id's of the skills the volunteer possesses
+            skill_ids = [row['skill_id'] for row in cursor.fetchall()] # Save all of the skill_ids to a list using list comprehension
+
+            # If there are any skills the user has
+            if skill_ids:
+                placeholders = ",".join("?" * len(skill_ids)) # Placeholders for skills, as don't know how many skills user has (Is also a secret safety against SQL injection)
+
+                # Find alll organisations that have events that require the skills the volunteer has (At least one overlap)
+                cursor.execute(f"""
+                    SELECT DISTINCT o.organisation_id, o.name, o.description, o.address
+                    FROM organisation o
+                    INNER JOIN event e ON o.organisation_id = e.organisation_id
+                    INNER JOIN event_skill es ON e.event_id = es.event_id
+                    WHERE es.skill_id IN ({placeholders})""", skill_ids)
+
+                organisations = cursor.fetchall() # Retrieve all matching organisations into list of dictionaries
+
+            # If volunteer has no skills, no organisations to match, so return empty list for HTML template message
             else:
                 organisations = []
 
@@ -239,7 +248,7 @@ def all_organisations():
             organisations = cursor.fetchall() # Fetch all organisations into list of dictionaries
 
     # Render template for organisations HTML page
-    return render_template("organisations.html", organisations=organisations, role=session.get('role'), filter = filter_type)
+    return render_template("organisations.html", organisations=organisations, role=principal.role, filter = filter_type)
     # 'filter = filter_type' to make sure dropdown menu text shows current mode of filter TOOK SO LONG TO FIX
 
 
@@ -248,16 +257,22 @@ def all_organisations():
 def my_account():
 
     # If user tries to access page before logging in, restrict it
-    if 'user_id' not in session:
+    principal = current_principal()
+    if not principal:
         flash("Please log in first.", "warning") # Throw error message
         return redirect(url_for('login')) # Redirect user back to the login page
 
+    # Hash a new password before taking the writer, hashing is slow and would hold up every other write
+    password_hash = None
+    if request.method == "POST" and request.form.get('password'):
+        password_hash = generate_password_hash(request.form.get('password'))
+
     # Pythonic way of initialising cursor object
-    with get_db() as conn:
+    with (get_db() if request.method == "POST" else get_read_db()) as conn: # Only POST writes, GET reads from the read pool
         cursor = conn.cursor()
 
         # Gather all of the user details (That corresponds to that user id)
-        cursor.execute("SELECT * FROM user WHERE user_id = ?", (session['user_id'],))
+        cursor.execute("SELECT * FROM user WHERE user_id = ?", (principal.user_id,))
         user = cursor.fetchone() # Fetch next available row
 
         # Initialise variables
@@ -270,17 +285,17 @@ def my_account():
             # Email, Phone number, Password
             email = request.form.get('email')
             phone_number = request.form.get('phone_number')
-            password = request.form.get('password')
 
             # Update password only if provided
-            if password:
-                password_hash = generate_password_hash(password) # Generate new password hash for password (Encryption)
+            if password_hash:
                 # Update all details of user
                 # If email or phone number not changed or changed, update either way (Easiest way to do it)
                 cursor.execute("""
                     UPDATE user 
                     SET email = ?, phone_number = ?, password_hash = ? 
                     WHERE user_id = ?""", (email, phone_number, password_hash, user['user_id']))
+
+                revoke_user_sessions(user['user_id'], keep_token=principal.token) # Log out every other device after a password change
             
             # If updated password not provided, only update the other fields
             else:
@@ -363,12 +378,13 @@ def my_account():
 def create_event():
     
     # Check if account logged in is an organisation account, because if not, cannot create events
-    if 'user_id' not in session or session.get('role') != 'organisation':
+    principal = current_principal()
+    if not principal or not principal.is_organisation:
         flash("Only organisations can create events.", "danger") # Throw error message
         return redirect(url_for('events')) # Redirect back to events page
 
     # Pythonic way of initialising cursor object
-    with get_db() as conn:
+    with (get_db() if request.method == "POST" else get_read_db()) as conn: # Only POST writes, GET reads from the read pool
         cursor = conn.cursor()
 
         # Fetch all available skills for form
@@ -385,27 +401,19 @@ def create_event():
             max_volunteers = request.form['max_volunteers']
             selected_skills = request.form.getlist('skills') # Get the list of all the skills from the skills table
 
-            # Get organisation_id for current user
-            cursor.execute("SELECT organisation_id FROM organisation WHERE user_id = ?", (session['user_id'],))
-            org = cursor.fetchone() # Fetch next availble row)
-
-            # Extra check to ensure that organisation exists
-            if not org:
-                flash("Organisation not found", "danger") # Throw error message
-                return redirect(url_for('events')) # Redirect user back to events page 
-
-            # Insert event
+            # Insert event (organisation_id already known from the session)
             cursor.execute('''INSERT INTO event (organisation_id, title, description, event_date, location, max_volunteers) VALUES (?, ?, ?, ?, ?, ?)''',
-                            (org['organisation_id'], title, description, event_date, location, max_volunteers))
+                            (principal.organisation_id, title, description, event_date, location, max_volunteers))
             event_id = cursor.lastrowid # Need event_id to insert into junction table
 
 
-            # Insert selected skills into junction
-            for skill_id in selected_skills[:3]:  # limit to 3 skills for user
-                cursor.execute("INSERT INTO event_skill (event_id, skill_id) VALUES (?, ?)", (event_id, skill_id)) # Insert skills
+            # Insert selected skills into junction, in the same transaction as the event (A bad skill choice rolls the event back too)
+            try:
+                set_event_skills(conn, event_id, selected_skills)
+            except SkillError as e:
+                flash(str(e), "warning") # Throw a warning message
+                return redirect(url_for('create_event')) # Back to the form
 
-            # Commit database changes
-            conn.commit()
             flash("Event created successfully!", "success") # Throw success message
             return redirect(url_for('events')) # Redirect user back to the events page
 
@@ -418,17 +426,16 @@ def create_event():
 def events():
 
     # If user not logged in, do not let them view the events
-    if 'user_id' not in session:
+    principal = current_principal()
+    if not principal:
         flash("You need to be logged in to explore the events!", "danger") # Throw error message
         return redirect(url_for('login')) # Redirect user to login page
 
     # Pythonic way of initialising cursor object
-    with get_db() as conn:
+    with get_read_db() as conn:
         cursor = conn.cursor()
 
-        # Get role of user, to see what view to present
-        cursor.execute("SELECT role FROM user WHERE user_id = ?", (session['user_id'],))
-        role = cursor.fetchone()['role'] # Fetch the role of user only (That's all that's needed)
+        role = principal.role # Role of user, to see what view to present (Resolved at login)
 
         # Fetch events with the volunteer count (Used GROUP BY here)
         cursor.execute("""
@@ -465,18 +472,10 @@ def events():
         # Volunteer’s skills
         volunteer_skills = [] # Initialise variable
 
-        # If the user is a volunteer,
-        if role == "volunteer":
-            
-            # Find the volunteer id from the supplied user id
-            cursor.execute("SELECT volunteer_id FROM volunteer WHERE user_id = ?", (session['user_id'],))
-            volunteer = cursor.fetchone() # Fetch next available row
-
-            # If the volunteer exists (Extra check)
-            if volunteer:
-                # Retrieve all skills associated with the volunteer
-                cursor.execute("SELECT skill_id FROM volunteer_skill WHERE volunteer_id = ?", (volunteer['volunteer_id'],))
-                volunteer_skills = [int(row['skill_id']) for row in cursor.fetchall()] # List comprehension iterates through each row, extracting skill id, and converting to integer and storing in list SO LONG TO DO
+        # If the user is a volunteer, retrieve all skills associated with the volunteer
+        if principal.is_volunteer:
+            cursor.execute("SELECT skill_id FROM volunteer_skill WHERE volunteer_id = ?", (principal.volunteer_id,))
+            volunteer_skills = [int(row['skill_id']) for row in cursor.fetchall()] # List comprehension iterates through each row, extracting skill id, and converting to integer and storing in list SO LONG TO DO
 
     # Render the actual events HTML page
     return render_template("events.html",
@@ -491,7 +490,8 @@ def events():
 def delete_event(event_id):
 
     # Check if user is organisation account, as if not, cannot delete events at all
-    if 'user_id' not in session or session.get('role') != 'organisation':
+    principal = current_principal()
+    if not principal or not principal.is_organisation:
         flash('You are not allowed to do that.', 'danger') # Throw error message
         return redirect(url_for('events')) # Redirect user back to events page
 
@@ -505,13 +505,9 @@ def delete_event(event_id):
 
         # If event exists
         if event:
-            # Get organisation_id of logged in user
-            cursor.execute('SELECT organisation_id FROM organisation WHERE user_id = ?', (session['user_id'],))
-            org = cursor.fetchone() # Fetch next available row
-
-            # Check if organisation_id is same as the one recorded in the event
+            # Check if organisation_id of logged in user is same as the one recorded in the event
             # If its the same, then that organisation created the event 
-            if org and org['organisation_id'] == event['organisation_id']:
+            if principal.organisation_id == event['organisation_id']:
                 cursor.execute('DELETE FROM event WHERE event_id = ?', (event_id,)) # Delete event
                 conn.commit() # Update changes
                 flash('Event deleted successfully.', 'success') # Throw success message
@@ -531,7 +527,8 @@ def delete_event(event_id):
 @app.route('/join_event/<int:event_id>', methods=['POST'])
 def join_event(event_id):
     # If user not logged in OR user is not a volunteer, restrict them from joining an event
-    if 'user_id' not in session or session.get('role') != 'volunteer':
+    principal = current_principal()
+    if not principal or not principal.is_volunteer:
         flash("Only volunteers can join events.", "danger") # Throw error message
         return redirect(url_for('events')) # Reload the page
 
@@ -539,46 +536,40 @@ def join_event(event_id):
     with get_db() as conn:
         cursor = conn.cursor()
 
-        # Get the volunteer id from the user id
-        cursor.execute("SELECT volunteer_id FROM volunteer WHERE user_id = ?", (session['user_id'],))
-        volunteer = cursor.fetchone() # Fetch next available row
+        # Check event capacity of the event
+        cursor.execute("SELECT max_volunteers FROM event WHERE event_id = ?", (event_id,))
+        event = cursor.fetchone() # Fetch next available row
+        
+        # If event doesn't exist (Extra safety check)
+        if not event:
+            flash("Event not found.", "danger") # Throw error message
+            return redirect(url_for('events')) # Redirect user back to the events page
 
-        # If volunteer actually exists (Extra safety check)
-        if volunteer:
-            # Check event capacity of the event
-            cursor.execute("SELECT max_volunteers FROM event WHERE event_id = ?", (event_id,))
-            event = cursor.fetchone() # Fetch next available row
-            
-            # If event doesn't exist (Extra safety check)
-            if not event:
-                flash("Event not found.", "danger") # Throw error message
-                return redirect(url_for('events')) # Redirect user back to the events page
+        # Count the currently accepted volunteers (To check if space)
+        cursor.execute("""
+            SELECT COUNT(*) AS count
+            FROM volunteer_event
+            WHERE event_id = ?""", (event_id,))
+        current_count = cursor.fetchone()["count"]
+
+        # If the event is full, where the current number of volunteers is same or more than the initial max number of volunteers
+        if event["max_volunteers"] is not None and current_count >= event["max_volunteers"]:
+            flash("Event is already full. Explore other events!", "warning") # Throw error message
+            return redirect(url_for('events')) # Reload the page
 
-            # Count the currently accepted volunteers (To check if space)
+        # 'try' to join the event (To catch errors)
+        try:
+            # Insert into the requesting to join events table, for organisation to accept
             cursor.execute("""
-                SELECT COUNT(*) AS count
-                FROM volunteer_event
-                WHERE event_id = ?""", (event_id,))
-            current_count = cursor.fetchone()["count"]
-
-            # If the event is full, where the current number of volunteers is same or more than the initial max number of volunteers
-            if event["max_volunteers"] is not None and current_count >= event["max_volunteers"]:
-                flash("Event is already full. Explore other events!", "warning") # Throw error message
-                return redirect(url_for('events')) # Reload the page
-
-            # 'try' to join the event (To catch errors)
-            try:
-                # Insert into the requesting to join events table, for organisation to accept
-                cursor.execute("""
-                    INSERT INTO event_request (volunteer_id, event_id, status)
-                    VALUES (?, ?, 'pending')""", (volunteer['volunteer_id'], event_id))
-                
-                conn.commit() # Save all committed changes
-                flash("Your request to join has been sent!", "success") # Send success message
+                INSERT INTO event_request (volunteer_id, event_id, status)
+                VALUES (?, ?, 'pending')""", (principal.volunteer_id, event_id))
+            
+            conn.commit() # Save all committed changes
+            flash("Your request to join has been sent!", "success") # Send success message
 
-            # If user tries to join event more than once, raise an error
-            except sqlite3.IntegrityError:
-                flash("You already requested to join this event.", "warning") # Throw error message
+        # If user tries to join event more than once, raise an error
+        except sqlite3.IntegrityError:
+            flash("You already requested to join this event.", "warning") # Throw error message
 
     return redirect(url_for('events')) # Render the events HTML page
 
@@ -588,21 +579,18 @@ def join_event(event_id):
 def manage_event(event_id):
 
     # If user not logged in OR user account is not an organisation account (Extra safety check)
-    if 'user_id' not in session or session.get('role') != 'organisation':
+    principal = current_principal()
+    if not principal or not principal.is_organisation:
         flash("Only organisations can manage events.", "danger") # Throw error message
         return redirect(url_for('events')) # Reload page
 
     # Pythonic way of initalising cursor object
-    with get_db() as conn:
+    with get_read_db() as conn:
         cursor = conn.cursor()
 
         # Ensure event belongs to this organisation
-        # Find organisation id from the user id
-        cursor.execute("SELECT organisation_id FROM organisation WHERE user_id = ?", (session['user_id'],))
-        org = cursor.fetchone() # Fetch next evailable row
-
-        # Find the record of that event owned by that organisation
-        cursor.execute("SELECT * FROM event WHERE event_id = ? AND organisation_id = ?", (event_id, org['organisation_id']))
+        # Find the record of that event owned by that organisation (organisation_id already known from the session)
+        cursor.execute("SELECT * FROM event WHERE event_id = ? AND organisation_id = ?", (event_id, principal.organisation_id))
         event = cursor.fetchone() # Fetch next available row
 
         # If organisation doesn't own that event, will be empty variable, hence organisation doesn't own event (Extra safety check)
@@ -630,24 +618,36 @@ def manage_event(event_id):
         
         attendees = cursor.fetchall() # Put all attendees as dictionaries in a list
 
-        # Find the average age of attendees on the bottom, as per requirements
+        # Find the average age of attendees on the bottom, as per requirements (From the precomputed event_stats row, not every attendee)
         cursor.execute("""
-            SELECT ROUND(AVG((julianday('now') - julianday(v.dob)) / 365), 1) AS avg_age
-            FROM volunteer_event ve
-            JOIN volunteer v ON ve.volunteer_id = v.volunteer_id
-            WHERE ve.event_id = ?""", (event_id,))
+            SELECT ROUND((julianday('now') - dob_julian_sum / dob_count) / 365, 1) AS avg_age
+            FROM event_stats
+            WHERE event_id = ? AND dob_count > 0""", (event_id,))
         
         avg_age_row = cursor.fetchone() # Fetch next available row
 
         # If the average age exists, then save it into variable, if not, initialise the variable as None (For the HTML template)
         avg_age = avg_age_row['avg_age'] if avg_age_row and avg_age_row['avg_age'] else None
 
+        # Suggested volunteers from the last matching run (Leaving out anyone who has requested since)
+        cursor.execute("""
+            SELECT v.first_name || ' ' || v.last_name AS full_name, CAST((julianday('now') - julianday(v.dob)) / 365 AS INT) AS age, u.email, c.score
+            FROM event_candidate c
+            JOIN volunteer v ON c.volunteer_id = v.volunteer_id
+            JOIN user u ON v.user_id = u.user_id
+            WHERE c.event_id = ?
+              AND NOT EXISTS (SELECT 1 FROM event_request er WHERE er.event_id = c.event_id AND er.volunteer_id = c.volunteer_id)
+            ORDER BY c.rank""", (event_id,))
+
+        candidates = cursor.fetchall() # Put all suggested volunteers as dictionaries in a list
+
     # Render the actual HTML page to manage the events
     return render_template("manage_event.html",
                            event=event,
                            requests=requests,
                            attendees=attendees,
-                           avg_age=avg_age)
+                           avg_age=avg_age,
+                           candidates=candidates)
 
 
 # Route for handling requests
@@ -655,7 +655,8 @@ def manage_event(event_id):
 def handle_request(request_id, action):
 
     # If user not logged in OR user account not organisation account, restrict from accessing 
-    if 'user_id' not in session or session.get('role') != 'organisation':
+    principal = current_principal()
+    if not principal or not principal.is_organisation:
         flash("Only organisations can handle requests.", "danger") # Throw error message
         return redirect(url_for('events')) # Redirect user back to the events page
 
@@ -701,47 +702,25 @@ def handle_request(request_id, action):
 def update_skills():
 
     # If user not logged in OR the user account is not a volunteer account, restrict them from trying to update skills
-    if 'user_id' not in session or session.get('role') != 'volunteer':
+    principal = current_principal()
+    if not principal or not principal.is_volunteer:
         flash("Only volunteers can update skills.", "danger") # Throw error message
         return redirect(url_for('my_account')) # Redirect user back to the information-updating page
 
-    user_id = session['user_id'] # If logged in, update session
-
-    # Pythonic way of initialising cursor object
-    with get_db() as conn:
-        cursor = conn.cursor()
-
-        # Double-check this user is really a volunteer, by trying to get the volunteer id from the user id
-        cursor.execute("SELECT volunteer_id FROM volunteer WHERE user_id = ?", (user_id,))
-        volunteer = cursor.fetchone() # Fetch next available row
+    volunteer_id = principal.volunteer_id # Resolved once at login, so no need to look it up again
 
-        # If not a volunteer, then throw an error before it crashes the app
-        if not volunteer:
-            flash("Volunteer record not found.", "danger") # Throw error message 
-            return redirect(url_for('my_account')) # Redirect user back to the my_account page
+    # Get submitted skills from the form as a list
+    selected_skills = request.form.getlist("skills")
 
-        volunteer_id = volunteer['volunteer_id'] # Put the volunteer_id into a separate variable, easier to use
-
-        # Debugging purposes (DON'T LEAVE IN)
-        print(f"Updating skills for volunteer_id={volunteer_id}, user_id={user_id}")
-
-        # Get submitted skills from the form as a list
-        selected_skills = request.form.getlist("skills")
-        print("Selected skills:", selected_skills) # Debugging purposes (DON'T LEAVE IN)
-
-        # Enforce max 3 skils only, if more than 3, raise an error
-        if len(selected_skills) > 3:
-            flash("You can only select up to 3 skills.", "warning") # Throw a warning message
+    # Pythonic way of opening the write connection
+    with get_db() as conn:
+        # Only writes the skills that changed, and checks the limit and that every skill exists (skills.py)
+        try:
+            set_volunteer_skills(conn, volunteer_id, selected_skills)
+        except SkillError as e:
+            flash(str(e), "warning") # Throw a warning message
             return redirect(url_for('my_account')) # Reload the page
 
-        # If successful in selecting, delete old records of the users skills
-        cursor.execute("DELETE FROM volunteer_skill WHERE volunteer_id = ?", (volunteer_id,))
-
-        # Insert new records of the users skills (Technically updates them)
-        for skill_id in selected_skills: # Loop through every skill and inserts it (Ensures atomicity IM COOKING)
-            cursor.execute("INSERT INTO volunteer_skill (volunteer_id, skill_id) VALUES (?, ?)",(volunteer_id, skill_id))
-
-        conn.commit() # Commit changes
         flash("Skills updated successfully.", "success") # Throw success message
 
     return redirect(url_for('my_account')) # Render actual HTML page
@@ -750,5 +729,4 @@ def update_skills():
 
 # Checks if script is run directly (Not imported)
 if __name__ == "__main__":
-    init_db() # Initialise database
     app.run(debug=True) # Runs the Flask application with debug mode enabled
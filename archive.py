@@ -0,0 +1,138 @@
+# Archiving of completed events
+# Moves old events, with their requests, attendees and skills, out of the live tables into the *_archive tables,
+# so the tables every page reads stay small. History is still there through the all_* views, and the
+# analytics summary tables keep counting archived events
+import sqlite3
+import time
+
+import click
+
+from models import app, connect_db, init_db
+
+ARCHIVE_AFTER_DAYS = 30 # Events are archived this many days after they happen (So organisations can still look back)
+BATCH_SIZE = 200 # Events moved per transaction, keeps each write short
+BATCH_PAUSE = 0.05 # Seconds between batches, so the website's writes get a turn
+BATCH_RETRIES = 5 # Times a batch is retried when the database is busy, before giving up on this run
+
+# Live table -> columns copied into its archive table
+ARCHIVED_TABLES = {
+    "event": "event_id, organisation_id, title, description, event_date, location, max_volunteers",
+    "event_skill": "event_id, skill_id",
+    "volunteer_event": "volunteer_id, event_id, signup_date",
+    "event_request": "request_id, volunteer_id, event_id, status",
+}
+
+
+# Raised when a batch still fails after its retries, 'moved' says how much was archived before that
+class ArchiveInterrupted(Exception):
+    def __init__(self, moved, error):
+        super().__init__(f"stopped after archiving {moved} events: {error}")
+        self.moved = moved
+        self.error = error
+
+
+# Move one batch of completed events, returns how many were moved
+def archive_batch(conn, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE):
+    cursor = conn.cursor()
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS archive_batch (event_id INTEGER PRIMARY KEY)")
+    conn.commit()
+
+    with conn:
+        # Take the write lock before reading anything, so a write committed by the website meanwhile can't
+        # make the read-to-write upgrade fail straight away (In WAL mode the busy timeout doesn't cover that)
+        cursor.execute("BEGIN IMMEDIATE")
+
+        # Pick the batch (Uses the event_date index)
+        cursor.execute("DELETE FROM archive_batch")
+        cursor.execute("""
+            INSERT INTO archive_batch (event_id)
+            SELECT event_id FROM event
+            WHERE event_date < date('now', ?)
+            ORDER BY event_date
+            LIMIT ?""", (f"-{int(older_than_days)} days", batch_size))
+        moved = cursor.rowcount
+
+        if moved <= 0:
+            return 0
+
+        # Tell the analytics triggers this is a move, not a delete, so the summary tables keep these events
+        cursor.execute("INSERT OR IGNORE INTO maintenance_flag (name) VALUES ('archiving')")
+
+        # Copy the parent rows first, then the children, so the archive never has rows pointing at nothing
+        for table, columns in ARCHIVED_TABLES.items():
+            cursor.execute(f"""
+                INSERT OR REPLACE INTO {table}_archive ({columns})
+                SELECT {columns} FROM {table}
+                WHERE event_id IN (SELECT event_id FROM archive_batch)""")
+
+        # Then remove them from the live tables, children first
+        for table in reversed(list(ARCHIVED_TABLES)):
+            cursor.execute(f"DELETE FROM {table} WHERE event_id IN (SELECT event_id FROM archive_batch)")
+        cursor.execute("DELETE FROM event_candidate WHERE event_id IN (SELECT event_id FROM archive_batch)") # No point suggesting volunteers for a finished event
+
+        cursor.execute("DELETE FROM maintenance_flag WHERE name = 'archiving'")
+
+    return moved
+
+
+# Keep archiving batches until nothing is old enough, returns the total moved
+def archive_events(conn, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    total = 0
+    failures = 0
+    while True:
+        try:
+            moved = archive_batch(conn, older_than_days, batch_size)
+        except sqlite3.OperationalError as e:
+            # Database busy (Or locked for longer than the timeout), wait a bit longer each time and retry the batch
+            failures += 1
+            if failures > BATCH_RETRIES:
+                raise ArchiveInterrupted(total, e)
+            time.sleep(pause * 2 ** failures)
+            continue
+
+        failures = 0
+        total += moved
+        if moved < batch_size:
+            return total
+        time.sleep(pause)
+
+
+# Check that every archived row still points at a real parent, returns a list of problems
+def check_archive(conn):
+    problems = []
+    for table in ("event_archive", "event_skill_archive", "volunteer_event_archive", "event_request_archive"):
+        for row in conn.execute(f"PRAGMA foreign_key_check({table})"):
+            problems.append(f"{row[0]} rowid {row[1]} points at a missing {row[2]} row")
+    return problems
+
+
+# Command to archive completed events: 'flask --app app archive-events [--older-than 30] [--every 3600]'
+@app.cli.command("archive-events")
+@click.option("--older-than", default=ARCHIVE_AFTER_DAYS, show_default=True, help="Archive events this many days in the past.")
+@click.option("--batch-size", default=BATCH_SIZE, show_default=True, help="Events moved per transaction.")
+@click.option("--every", default=0, help="Keep running, archiving every this many seconds (0 runs once).")
+def archive_events_command(older_than, batch_size, every):
+    init_db() # Make sure the archive tables exist on a database that hasn't been started yet
+
+    while True:
+        conn = connect_db()
+        started = time.perf_counter()
+        try:
+            moved = archive_events(conn, older_than, batch_size)
+            problems = check_archive(conn)
+        except ArchiveInterrupted as e:
+            if not every:
+                raise click.ClickException(f"Archived {e.moved} events, then stopped: {e.error}")
+            click.echo(f"Archived {e.moved} events, then stopped: {e.error}. Trying again in {every}s.") # Keep the job alive
+            problems = None
+        finally:
+            conn.close()
+
+        if problems is not None:
+            click.echo(f"Archived {moved} events in {time.perf_counter() - started:.2f}s.")
+            for problem in problems:
+                click.echo(f"  integrity: {problem}")
+
+        if not every:
+            return
+        time.sleep(every)
@@ -0,0 +1,161 @@
+# Fingerprinted, precompressed static assets
+# 'flask --app app build-assets' copies each file in static/ to static/dist/ under a name with a hash of its contents
+# (layout.css -> layout.3f2a1b9c04de.css), next to gzip (And brotli, if installed) copies. Templates link them with
+# asset_url(), and /assets/ serves the smallest variant the browser accepts with a one year immutable cache,
+# so repeat visits don't ask for them again. A changed file gets a new name, so nothing stale is ever served
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+import click
+from flask import abort, request, send_from_directory, url_for
+
+from models import app
+from principal import SESSIONLESS_ENDPOINTS
+
+# Brotli is optional, only gzip copies are made when it isn't installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = app.static_folder
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+HASH_LENGTH = 12 # Hex characters of sha256 in the file name
+COMPRESS_EXTENSIONS = {".css", ".js", ".svg", ".html", ".json", ".txt"} # Images and fonts are compressed already
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_manifest = {"mtime": None, "files": {}} # Loaded manifest, reloaded when the build changes it
+
+SESSIONLESS_ENDPOINTS.add('asset') # Assets are the same for everyone, so the session is never looked up for them
+
+
+# Original name -> fingerprinted name, e.g. 'layout.css' -> 'layout.3f2a1b9c04de.css'
+def fingerprint(name, data):
+    root, ext = os.path.splitext(name)
+    return f"{root}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{ext}"
+
+
+# Write a file via a temporary name, so the server never serves half of one
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+# Fingerprint and compress everything in static/ into static/dist/, returns the manifest
+def build_assets(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    manifest = {}
+    written = set()
+
+    for folder, dirs, files in os.walk(static_dir):
+        if os.path.abspath(folder) == os.path.abspath(static_dir) and "dist" in dirs:
+            dirs.remove("dist") # Don't build the build
+        for file in files:
+            path = os.path.join(folder, file)
+            name = os.path.relpath(path, static_dir).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                data = f.read()
+
+            hashed = fingerprint(name, data)
+            manifest[name] = hashed
+            out_path = os.path.join(dist_dir, hashed)
+            written.add(hashed)
+
+            if not os.path.exists(out_path): # Same hash, same contents, nothing to do
+                write_atomic(out_path, data)
+
+            # Compressed copies, only kept when they are actually smaller
+            if os.path.splitext(name)[1] in COMPRESS_EXTENSIONS:
+                variants = [(".gz", lambda d: gzip.compress(d, compresslevel=9, mtime=0))] # mtime=0 so rebuilds give the same bytes
+                if brotli is not None:
+                    variants.append((".br", lambda d: brotli.compress(d, quality=11)))
+                for suffix, compress in variants:
+                    if os.path.exists(out_path + suffix):
+                        written.add(hashed + suffix)
+                        continue
+                    compressed = compress(data)
+                    if len(compressed) < len(data):
+                        write_atomic(out_path + suffix, compressed)
+                        written.add(hashed + suffix)
+
+    # The manifest goes last, so the links only change once every file is in place
+    write_atomic(os.path.join(dist_dir, "manifest.json"), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    written.add("manifest.json")
+
+    # Clear out builds of old versions
+    for folder, _, files in os.walk(dist_dir):
+        for file in files:
+            name = os.path.relpath(os.path.join(folder, file), dist_dir).replace(os.sep, "/")
+            if name not in written:
+                os.remove(os.path.join(folder, file))
+
+    return manifest
+
+
+# The current manifest (Empty if assets haven't been built), checked for changes by modification time
+def load_manifest():
+    try:
+        mtime = os.stat(MANIFEST_PATH).st_mtime
+    except OSError:
+        return {}
+
+    if mtime != _manifest["mtime"]:
+        with open(MANIFEST_PATH) as f:
+            _manifest["files"] = json.load(f)
+        _manifest["mtime"] = mtime
+    return _manifest["files"]
+
+
+# URL for a static file in templates: '{{ asset_url('layout.css') }}'
+# Falls back to the plain /static/ URL when the assets haven't been built (e.g. in development)
+@app.template_global()
+def asset_url(filename):
+    hashed = load_manifest().get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('asset', filename=hashed)
+
+
+# Serve a fingerprinted file, precompressed if the browser takes it
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    path = os.path.join(DIST_DIR, filename)
+    if filename == "manifest.json" or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    served, encoding = filename, None
+    for suffix, name in ((".br", "br"), (".gz", "gzip")):
+        if request.accept_encodings[name] and os.path.isfile(path + suffix):
+            served, encoding = filename + suffix, name
+            break
+
+    response = send_from_directory(DIST_DIR, served, mimetype=mimetype, max_age=31536000)
+    response.headers["Cache-Control"] = IMMUTABLE
+    response.headers["Vary"] = "Accept-Encoding" # Same file for every user, so caches only split by encoding
+    response.headers.pop("Content-Disposition", None) # Would name the .gz/.br file, and browsers don't need it for assets
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+# Command to build the assets: 'flask --app app build-assets' (Run on every deploy)
+@app.cli.command("build-assets")
+@click.option("--clean", is_flag=True, help="Delete static/dist first and build everything again.")
+def build_assets_command(clean):
+    if clean and os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+
+    manifest = build_assets()
+    for name, hashed in sorted(manifest.items()):
+        sizes = [f"{os.path.getsize(os.path.join(DIST_DIR, hashed))} B"]
+        for suffix in (".gz", ".br"):
+            if os.path.exists(os.path.join(DIST_DIR, hashed + suffix)):
+                sizes.append(f"{suffix[1:]} {os.path.getsize(os.path.join(DIST_DIR, hashed + suffix))} B")
+        click.echo(f"{name} -> {hashed} ({', '.join(sizes)})")
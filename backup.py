@@ -0,0 +1,177 @@
+# Online backups of database.db
+# Copies the live database with the SQLite backup API a batch of pages at a time (Pausing between batches so the
+# website's requests aren't held up), then gzips the copy, records checksums next to it and prunes old backups.
+# Restores check the checksums and run an integrity check before the new file is put in place
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+import click
+
+from models import app, base_dir, db_path
+
+BACKUP_DIR = os.path.join(base_dir, "backups")
+BACKUP_KEEP = 7 # Backups kept, older ones are deleted
+BACKUP_PAGES = 256 # Pages copied per step
+BACKUP_PAUSE = 0.005 # Seconds to pause between steps
+BACKUP_LEVEL = 1 # gzip level, the fastest one costs the website the least CPU and SQLite pages still shrink well
+CHUNK = 1024 * 1024 # Read/write size when compressing and hashing
+
+
+# sha256 of a file, read in chunks so big files don't fill memory
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Copy the live database into a plain file at 'dest_path', without blocking writers
+def copy_database(source_path, dest_path, pages=BACKUP_PAGES, pause=BACKUP_PAUSE):
+    src = sqlite3.connect(source_path, timeout=10)
+    dst = sqlite3.connect(dest_path)
+
+    try:
+        # Hold a read transaction for the whole copy: in WAL mode that pins one consistent snapshot,
+        # so writes committed meanwhile don't force the backup to start over
+        src.execute("BEGIN")
+        src.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+
+        # The backup API only sleeps when the database is busy, so pause after each step ourselves
+        def step_done(status, remaining, total):
+            if remaining and pause:
+                time.sleep(pause)
+
+        src.backup(dst, pages=pages, progress=step_done)
+        src.rollback()
+
+        dst.execute("PRAGMA journal_mode=DELETE") # Single self-contained file, no -wal next to it
+    finally:
+        dst.close()
+        src.close()
+
+
+# Make a compressed, checksummed backup and prune old ones, returns the path of the new backup
+def create_backup(source_path=db_path, backup_dir=BACKUP_DIR, keep=BACKUP_KEEP, pages=BACKUP_PAGES, pause=BACKUP_PAUSE):
+    os.makedirs(backup_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    name = "database-" + datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    raw_path = os.path.join(backup_dir, name + ".db.tmp")
+    gz_path = os.path.join(backup_dir, name + ".db.gz")
+
+    try:
+        copy_database(source_path, raw_path, pages, pause)
+        copied = time.perf_counter()
+
+        # Compress, hashing the plain copy along the way (So a restore can prove it got the same bytes back)
+        raw_digest = hashlib.sha256()
+        with open(raw_path, "rb") as raw, gzip.open(gz_path + ".tmp", "wb", compresslevel=BACKUP_LEVEL) as gz:
+            for block in iter(lambda: raw.read(CHUNK), b""):
+                raw_digest.update(block)
+                gz.write(block)
+        os.replace(gz_path + ".tmp", gz_path)
+
+        manifest = {
+            "file": os.path.basename(gz_path),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "db_bytes": os.path.getsize(raw_path),
+            "gz_bytes": os.path.getsize(gz_path),
+            "db_sha256": raw_digest.hexdigest(),
+            "gz_sha256": file_sha256(gz_path),
+            "copy_seconds": round(copied - started, 3),
+            "total_seconds": round(time.perf_counter() - started, 3),
+        }
+        with open(gz_path + ".json", "w") as f:
+            json.dump(manifest, f, indent=2)
+    finally:
+        for leftover in (raw_path, gz_path + ".tmp"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    prune_backups(backup_dir, keep)
+    return gz_path
+
+
+# Backups in a folder, newest first
+def list_backups(backup_dir=BACKUP_DIR):
+    if not os.path.isdir(backup_dir):
+        return []
+    names = sorted((n for n in os.listdir(backup_dir) if n.endswith(".db.gz")), reverse=True) # Timestamped names sort by age
+    return [os.path.join(backup_dir, n) for n in names]
+
+
+# Delete all but the newest 'keep' backups
+def prune_backups(backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    for path in list_backups(backup_dir)[keep:]:
+        for old in (path, path + ".json"):
+            if os.path.exists(old):
+                os.remove(old)
+
+
+# Restore a backup into a new file (Never over an existing one), raises ValueError if anything doesn't check out
+def restore_backup(backup_path, target_path):
+    if os.path.exists(target_path):
+        raise ValueError(f"{target_path} already exists, restore into a new file.")
+
+    with open(backup_path + ".json") as f:
+        manifest = json.load(f)
+
+    # The compressed file must be exactly what was written
+    if file_sha256(backup_path) != manifest["gz_sha256"]:
+        raise ValueError("Backup file checksum doesn't match, the file is damaged.")
+
+    tmp_path = target_path + ".tmp"
+    try:
+        # Decompress, checking the plain bytes match what was backed up
+        digest = hashlib.sha256()
+        with gzip.open(backup_path, "rb") as gz, open(tmp_path, "wb") as out:
+            for block in iter(lambda: gz.read(CHUNK), b""):
+                digest.update(block)
+                out.write(block)
+        if digest.hexdigest() != manifest["db_sha256"]:
+            raise ValueError("Restored database checksum doesn't match the backup.")
+
+        # And SQLite has to agree the file is sound
+        conn = sqlite3.connect(tmp_path)
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        conn.close()
+        if result != "ok":
+            raise ValueError(f"Integrity check failed: {result}")
+
+        shutil.move(tmp_path, target_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return manifest
+
+
+# Command to back up the database: 'flask --app app backup-db [--keep 7]'
+@app.cli.command("backup-db")
+@click.option("--keep", default=BACKUP_KEEP, show_default=True, help="Backups to keep.")
+@click.option("--pages", default=BACKUP_PAGES, show_default=True, help="Pages copied per step.")
+@click.option("--pause", default=BACKUP_PAUSE, show_default=True, help="Seconds to pause between steps.")
+def backup_db_command(keep, pages, pause):
+    path = create_backup(keep=keep, pages=pages, pause=pause)
+    with open(path + ".json") as f:
+        manifest = json.load(f)
+    click.echo(f"Backed up {manifest['db_bytes']} bytes to {path} ({manifest['gz_bytes']} compressed) in {manifest['total_seconds']}s.")
+
+
+# Command to restore a backup into a new file: 'flask --app app restore-db backups/<file>.db.gz restored.db'
+@app.cli.command("restore-db")
+@click.argument("backup_path")
+@click.argument("target_path")
+def restore_db_command(backup_path, target_path):
+    try:
+        manifest = restore_backup(backup_path, target_path)
+    except (ValueError, OSError) as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Restored backup from {manifest['created_at']} into {target_path}, integrity check ok.")
@@ -0,0 +1,75 @@
+# Benchmark: the /events HTML page against the JSON API, latency and bytes sent
+# Seeds a database, logs in as a volunteer and fetches the same events as a whole page,
+# as API pages of 50 (Walking the cursor to the end), and as a projected, compressed API page
+#
+# Run with: python benchmarks/bench_api.py [events]
+import sys
+import time
+
+from werkzeug.security import generate_password_hash
+
+from seed import percentile, seed, temp_db
+
+import models
+from models import ReadPool, Writer, connect_db
+import app as webapp # Registers the routes
+
+REQUESTS = 20 # Requests timed per case
+
+
+def time_get(client, url, headers=None):
+    client.get(url, headers=headers) # Warm up
+    times = []
+    for _ in range(REQUESTS):
+        started = time.perf_counter()
+        response = client.get(url, headers=headers)
+        times.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.data
+    return times, len(response.data)
+
+
+# Walk every page of the API, returns (seconds, bytes, pages)
+def walk_pages(client, url):
+    started = time.perf_counter()
+    total_bytes, pages, cursor = 0, 0, None
+    while True:
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        total_bytes += len(response.data)
+        pages += 1
+        cursor = response.json["next_cursor"]
+        if not cursor:
+            return time.perf_counter() - started, total_bytes, pages
+
+
+if __name__ == "__main__":
+    n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    path = temp_db()
+    seed(path, volunteers=5000, events=n_events)
+
+    # Point the app's connections at the benchmark database
+    models.read_pool = ReadPool(path, models.READ_POOL_SIZE)
+    models.writer = Writer(path)
+
+    # Log in as one of the seeded volunteers
+    conn = connect_db(path)
+    with conn:
+        conn.execute("UPDATE user SET password_hash = ? WHERE email = 'vol0@bench.test'", (generate_password_hash("bench"),))
+    conn.close()
+    client = models.app.test_client()
+    client.post("/login", data={"email": "vol0@bench.test", "password": "bench"})
+
+    print(f"{n_events} events")
+    cases = [
+        ("/events (HTML)", "/events", None),
+        ("API page of 50", "/api/v1/events?limit=50", None),
+        ("API page, gzip", "/api/v1/events?limit=50", {"Accept-Encoding": "gzip"}),
+        ("API page, 3 fields, gzip", "/api/v1/events?limit=50&fields=event_id,title,event_date", {"Accept-Encoding": "gzip"}),
+        ("API batch of 20 ids", "/api/v1/events?ids=" + ",".join(str(i) for i in range(1, 21)), None),
+    ]
+    for label, url, headers in cases:
+        times, size = time_get(client, url, headers)
+        print(f"  {label:<26} p50 {percentile(times, 50):7.2f} ms  p99 {percentile(times, 99):7.2f} ms  {size / 1024:8.1f} KB")
+
+    seconds, total_bytes, pages = walk_pages(client, "/api/v1/events?limit=200")
+    print(f"  all events through the API: {pages} pages in {seconds * 1000:.1f} ms, {total_bytes / 1024:.1f} KB")
@@ -0,0 +1,76 @@
+# Benchmark: /events latency before and after archiving completed events
+# Seeds a database where most events are in the past, times the real /events route,
+# archives everything older than today and times it again
+#
+# Run with: python benchmarks/bench_archive.py [events] [past fraction]
+import sys
+import time
+
+from werkzeug.security import generate_password_hash
+
+from seed import percentile, seed, temp_db
+
+import models
+from models import ReadPool, Writer, connect_db
+import app as webapp # Registers the routes
+from analytics import check_analytics
+from archive import archive_events, check_archive
+
+REQUESTS = 20 # /events requests timed per run
+
+
+def time_events(client):
+    client.get("/events") # Warm up
+    times = []
+    for _ in range(REQUESTS):
+        started = time.perf_counter()
+        response = client.get("/events")
+        times.append(time.perf_counter() - started)
+        assert response.status_code == 200
+    return times
+
+
+def table_sizes(path):
+    conn = connect_db(path)
+    sizes = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("event", "event_request", "volunteer_event")}
+    conn.close()
+    return sizes
+
+
+if __name__ == "__main__":
+    n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    past_fraction = float(sys.argv[2]) if len(sys.argv) > 2 else 0.9
+
+    path = temp_db()
+    seed(path, volunteers=5000, events=n_events, past_fraction=past_fraction)
+
+    # Point the app's connections at the benchmark database
+    models.read_pool = ReadPool(path, models.READ_POOL_SIZE)
+    models.writer = Writer(path)
+
+    # Log in as one of the seeded volunteers
+    conn = connect_db(path)
+    with conn:
+        conn.execute("UPDATE user SET password_hash = ? WHERE email = 'vol0@bench.test'", (generate_password_hash("bench"),))
+    conn.close()
+    client = models.app.test_client()
+    client.post("/login", data={"email": "vol0@bench.test", "password": "bench"})
+
+    before = time_events(client)
+    sizes_before = table_sizes(path)
+
+    conn = connect_db(path)
+    started = time.perf_counter()
+    moved = archive_events(conn, older_than_days=0)
+    archive_time = time.perf_counter() - started
+    problems = check_archive(conn)
+    mismatches = check_analytics(conn)
+    conn.close()
+
+    after = time_events(client)
+    sizes_after = table_sizes(path)
+
+    print(f"{n_events} events, {past_fraction:.0%} in the past")
+    print(f"  before archive: p50 {percentile(before, 50):8.1f} ms  p99 {percentile(before, 99):8.1f} ms  {sizes_before}")
+    print(f"  archived {moved} events in {archive_time:.2f}s, integrity problems: {len(problems)}, analytics mismatches: {mismatches or 'none'}")
+    print(f"  after archive : p50 {percentile(after, 50):8.1f} ms  p99 {percentile(after, 99):8.1f} ms  {sizes_after}")
@@ -0,0 +1,104 @@
+# Benchmark: backup throughput, and what a running backup does to live read/write latency
+# The backup runs in its own process (Like the 'backup-db' command would), while threads in this process
+# keep reading the events listing and writing join requests
+#
+# Run with: python benchmarks/bench_backup.py
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from seed import percentile, seed, temp_db
+
+from backup import create_backup, restore_backup
+from bench_read_write import EVENTS_QUERY
+
+# (pages per step, pause between steps) settings to try
+SETTINGS = [(-1, 0), (1024, 0.0), (256, 0.005), (64, 0.005)]
+READERS = 4
+
+
+def run_backup(path, backup_dir, pages, pause, result):
+    backup_path = create_backup(path, backup_dir, keep=1, pages=pages, pause=pause)
+    with open(backup_path + ".json") as f:
+        manifest = json.load(f)
+    result[0] = manifest["copy_seconds"]
+    result[1] = manifest["total_seconds"]
+
+
+# Read and write against the live database until 'done' is set, returns the latencies
+def live_traffic(path, ids, done):
+    read_times, write_times = [], []
+
+    def reader():
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=10)
+        while not done.is_set():
+            started = time.perf_counter()
+            conn.execute(EVENTS_QUERY).fetchall()
+            read_times.append(time.perf_counter() - started)
+
+    def writer():
+        conn = sqlite3.connect(path, timeout=10)
+        rng = random.Random(1)
+        while not done.is_set():
+            started = time.perf_counter()
+            conn.execute("INSERT OR IGNORE INTO event_request (volunteer_id, event_id, status) VALUES (?, ?, 'pending')",
+                         (rng.choice(ids["volunteer_ids"]), rng.choice(ids["event_ids"])))
+            conn.commit()
+            write_times.append(time.perf_counter() - started)
+            time.sleep(0.002)
+
+    threads = [threading.Thread(target=reader) for _ in range(READERS)] + [threading.Thread(target=writer)]
+    for t in threads:
+        t.start()
+    return threads, read_times, write_times
+
+
+def report(label, read_times, write_times, extra=""):
+    print(f"  {label:<22} reads p50 {percentile(read_times, 50):6.2f} ms p99 {percentile(read_times, 99):7.2f} ms | "
+          f"writes p50 {percentile(write_times, 50):5.2f} ms p99 {percentile(write_times, 99):7.2f} ms {extra}")
+
+
+if __name__ == "__main__":
+    path = temp_db()
+    ids = seed(path, volunteers=50000, events=5000, joins_per_event=30)
+    size_mb = os.path.getsize(path) / 1024 / 1024
+    backup_dir = tempfile.mkdtemp(prefix="cc_backups_")
+    print(f"database: {size_mb:.1f} MB")
+
+    # Baseline, no backup running
+    done = threading.Event()
+    threads, read_times, write_times = live_traffic(path, ids, done)
+    time.sleep(3)
+    done.set()
+    for t in threads:
+        t.join()
+    report("no backup", read_times, write_times)
+
+    for pages, pause in SETTINGS:
+        done = threading.Event()
+        threads, read_times, write_times = live_traffic(path, ids, done)
+        time.sleep(0.5)
+
+        result = multiprocessing.Array("d", 2) # Seconds spent copying, seconds in total (Copy + compress + checksums)
+        process = multiprocessing.Process(target=run_backup, args=(path, backup_dir, pages, pause, result))
+        process.start()
+        process.join()
+
+        done.set()
+        for t in threads:
+            t.join()
+        report(f"pages={pages} pause={pause}", read_times, write_times,
+               f"| copy {result[0]:.2f}s ({size_mb / result[0]:.1f} MB/s), total {result[1]:.2f}s ({size_mb / result[1]:.1f} MB/s)")
+
+    # Restore the last backup and time it
+    backup_path = sorted(f for f in os.listdir(backup_dir) if f.endswith(".db.gz"))[-1]
+    target = os.path.join(backup_dir, "restored.db")
+    started = time.perf_counter()
+    manifest = restore_backup(os.path.join(backup_dir, backup_path), target)
+    print(f"restore with integrity check: {time.perf_counter() - started:.2f}s "
+          f"({manifest['gz_bytes'] / 1024 / 1024:.1f} MB compressed, {manifest['db_bytes'] / 1024 / 1024:.1f} MB restored)")
@@ -0,0 +1,44 @@
+# Benchmark: batch volunteer x event scoring at 100k volunteers x 10k events
+# Uses random arrays shaped like load_matching_data() output, so no database is needed
+#
+# Run with: python benchmarks/bench_matching.py [volunteers] [events] [skills]
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import seed # Puts the project folder on the path
+
+from matching import TOP_N, top_candidates
+
+
+def make_data(n_volunteers, n_events, n_skills, rng):
+    volunteer_skills = (rng.random((n_volunteers, n_skills)) < min(1.0, 2 / n_skills)).astype(np.float32)
+    event_skills = (rng.random((n_events, n_skills)) < min(1.0, 2 / n_skills)).astype(np.float32)
+    volunteer_ages = rng.uniform(16, 75, n_volunteers).astype(np.float32)
+    event_ages = np.where(rng.random(n_events) < 0.3, np.nan, rng.uniform(18, 60, n_events)).astype(np.float32)
+    excluded = np.stack([rng.integers(0, n_events, n_events * 10), rng.integers(0, n_volunteers, n_events * 10)], axis=1)
+    return volunteer_skills, volunteer_ages, event_skills, event_ages, excluded
+
+
+if __name__ == "__main__":
+    n_volunteers = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_events = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    n_skills = int(sys.argv[3]) if len(sys.argv) > 3 else 4 # The skill catalogue has 4 skills
+
+    rng = np.random.default_rng(1)
+    data = make_data(n_volunteers, n_events, n_skills, rng)
+
+    tracemalloc.start() # NumPy reports its allocations to tracemalloc
+    started = time.perf_counter()
+    event_index, volunteer_index, scores = top_candidates(*data, top_n=TOP_N)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    pairs = n_volunteers * n_events
+    print(f"{n_volunteers} volunteers x {n_events} events, {n_skills} skills, top {TOP_N}")
+    print(f"  time        : {elapsed:.2f} s ({pairs / elapsed / 1e6:.0f}M pairs/s)")
+    print(f"  peak memory : {peak / 1024 / 1024:.0f} MB (Full matrix would be {pairs * 4 / 1024 / 1024:.0f} MB)")
+    print(f"  candidates  : {len(scores)}")
@@ -0,0 +1,110 @@
+# Benchmark: do reads still wait on join_event / update_skills writes?
+# Compares the old setup (one read-write connection per request, rollback journal)
+# with the read/write split (WAL, pooled 'mode=ro' readers, one serialised writer)
+#
+# Run with: python benchmarks/bench_read_write.py
+import random
+import sqlite3
+import threading
+import time
+
+from seed import percentile, seed, temp_db
+
+from models import ReadPool, Writer
+
+READERS = 8 # Threads hammering the events listing
+WRITERS = 2 # Threads doing join_event and update_skills style writes
+DURATION = 5.0 # Seconds per run
+
+EVENTS_QUERY = """
+    SELECT e.event_id, e.title, e.description, e.event_date, e.location, o.name AS name, u.user_id, COUNT(ve.volunteer_id) AS volunteer_count
+    FROM event e
+    INNER JOIN organisation o ON e.organisation_id = o.organisation_id
+    INNER JOIN user u ON o.user_id = u.user_id
+    LEFT JOIN volunteer_event ve ON e.event_id = ve.event_id
+    GROUP BY e.event_id
+"""
+
+
+# Same writes the join_event and update_skills routes do, one transaction each
+def do_write(conn, rng, ids):
+    volunteer_id = rng.choice(ids["volunteer_ids"])
+    if rng.random() < 0.5:
+        conn.execute("INSERT OR IGNORE INTO event_request (volunteer_id, event_id, status) VALUES (?, ?, 'pending')",
+                     (volunteer_id, rng.choice(ids["event_ids"])))
+    else:
+        conn.execute("DELETE FROM volunteer_skill WHERE volunteer_id = ?", (volunteer_id,))
+        for skill_id in rng.sample(ids["skill_ids"], 2):
+            conn.execute("INSERT INTO volunteer_skill (volunteer_id, skill_id) VALUES (?, ?)", (volunteer_id, skill_id))
+    conn.commit()
+
+
+def run(path, ids, split):
+    read_times, write_times, errors = [], [], []
+    stop = time.time() + DURATION
+    pool = ReadPool(path, READERS) if split else None
+    writer = Writer(path) if split else None
+
+    def reader():
+        while time.time() < stop:
+            started = time.perf_counter()
+            try:
+                if split:
+                    conn = pool.acquire()
+                    conn.execute(EVENTS_QUERY).fetchall()
+                    pool.release(conn)
+                else:
+                    conn = sqlite3.connect(path, timeout=10) # What get_db() used to do on every request
+                    conn.execute(EVENTS_QUERY).fetchall()
+                    conn.close()
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+                continue
+            read_times.append(time.perf_counter() - started)
+
+    def write_loop(seed_value):
+        rng = random.Random(seed_value)
+        while time.time() < stop:
+            started = time.perf_counter()
+            try:
+                if split:
+                    with writer.transaction() as conn:
+                        do_write(conn, rng, ids)
+                else:
+                    conn = sqlite3.connect(path, timeout=10)
+                    do_write(conn, rng, ids)
+                    conn.close()
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+                continue
+            write_times.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=reader) for _ in range(READERS)]
+    threads += [threading.Thread(target=write_loop, args=(i,)) for i in range(WRITERS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return read_times, write_times, errors
+
+
+def report(label, read_times, write_times, errors):
+    print(f"{label}")
+    print(f"  reads : {len(read_times) / DURATION:8.1f}/s  p50 {percentile(read_times, 50):7.2f} ms  p99 {percentile(read_times, 99):7.2f} ms")
+    print(f"  writes: {len(write_times) / DURATION:8.1f}/s  p50 {percentile(write_times, 50):7.2f} ms  p99 {percentile(write_times, 99):7.2f} ms")
+    print(f"  errors: {len(errors)}")
+
+
+if __name__ == "__main__":
+    # Old setup: rollback journal, so a committing writer locks readers out
+    path = temp_db()
+    ids = seed(path)
+    with sqlite3.connect(path) as conn:
+        conn.execute("PRAGMA journal_mode=DELETE")
+    report("shared read-write connections (rollback journal)", *run(path, ids, split=False))
+
+    # New setup: init_db already switched the file to WAL
+    path = temp_db()
+    ids = seed(path)
+    report("read/write split (WAL, ro pool, single writer)", *run(path, ids, split=True))
@@ -0,0 +1,63 @@
+# Benchmark: skill updates, delete-and-reinsert against the diff-based assign_skills()
+# Times resubmitting the same skills (The common case on the account page) and swapping one skill,
+# and counts the rows written (Including the analytics triggers' writes) through SQLite's total_changes
+#
+# Run with: python benchmarks/bench_skills.py
+import random
+import time
+
+from seed import seed, temp_db
+
+from models import connect_db
+import matching # Registers the candidate invalidation listener
+from skills import set_volunteer_skills
+
+UPDATES = 2000
+
+
+# How skill updates used to be done
+def delete_and_reinsert(conn, volunteer_id, skill_ids):
+    with conn:
+        conn.execute("DELETE FROM volunteer_skill WHERE volunteer_id = ?", (volunteer_id,))
+        for skill_id in skill_ids:
+            conn.execute("INSERT INTO volunteer_skill (volunteer_id, skill_id) VALUES (?, ?)", (volunteer_id, skill_id))
+
+
+def run(conn, update, plans):
+    changes = conn.total_changes
+    started = time.perf_counter()
+    for volunteer_id, skill_ids in plans:
+        update(conn, volunteer_id, skill_ids)
+    return (time.perf_counter() - started) / len(plans) * 1000, (conn.total_changes - changes) / len(plans)
+
+
+if __name__ == "__main__":
+    path = temp_db()
+    ids = seed(path, volunteers=5000, events=2000)
+    conn = connect_db(path)
+    rng = random.Random(1)
+
+    current = {}
+    for row in conn.execute("SELECT volunteer_id, skill_id FROM volunteer_skill"):
+        current.setdefault(row["volunteer_id"], []).append(str(row["skill_id"]))
+    volunteers = rng.sample(sorted(current), UPDATES)
+
+    # Same skills sent again
+    same = [(v, current[v]) for v in volunteers]
+
+    # One skill swapped for one the volunteer doesn't have
+    swapped = []
+    for v in volunteers:
+        skills = list(current[v])
+        spare = [str(s) for s in ids["skill_ids"] if str(s) not in skills]
+        if spare:
+            skills[0] = rng.choice(spare)
+        swapped.append((v, skills))
+
+    print(f"{UPDATES} updates, ms per update / rows written per update")
+    for label, plans in (("unchanged", same), ("one skill swapped", swapped)):
+        old_ms, old_rows = run(conn, delete_and_reinsert, plans)
+        run(conn, delete_and_reinsert, same) # Put things back
+        new_ms, new_rows = run(conn, set_volunteer_skills, plans)
+        run(conn, set_volunteer_skills, same)
+        print(f"  {label:<18} delete+reinsert {old_ms:6.3f} ms {old_rows:5.1f} rows | diff {new_ms:6.3f} ms {new_rows:5.1f} rows")
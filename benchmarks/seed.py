@@ -0,0 +1,88 @@
+# Shared helpers for the benchmark scripts (Builds a throwaway database full of fake data)
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+# Benchmarks live one folder down, so make 'models' importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from models import connect_db, init_db
+
+
+# Make a fresh database in a temporary folder and return its path
+def temp_db(name="bench.db"):
+    folder = tempfile.mkdtemp(prefix="cc_bench_")
+    path = os.path.join(folder, name)
+    init_db(path)
+    return path
+
+
+# Fill the database with organisations, volunteers, events, skills, requests and attendees
+def seed(path, organisations=50, volunteers=2000, events=500, past_fraction=0.0, joins_per_event=10, seed_value=1):
+    rng = random.Random(seed_value) # Fixed seed so runs are comparable
+    today = date.today()
+
+    conn = connect_db(path)
+    with conn:
+        cursor = conn.cursor()
+        skill_ids = [row["skill_id"] for row in cursor.execute("SELECT skill_id FROM skill")]
+
+        # Users for organisations, then the organisations themselves
+        cursor.executemany("INSERT INTO user (email, password_hash, role) VALUES (?, 'x', 'organisation')",
+                           [(f"org{i}@bench.test",) for i in range(organisations)])
+        org_user_ids = [row["user_id"] for row in cursor.execute("SELECT user_id FROM user WHERE role = 'organisation' ORDER BY user_id")]
+        cursor.executemany("INSERT INTO organisation (user_id, name, description) VALUES (?, ?, 'Benchmark organisation')",
+                           [(uid, f"Org {i}") for i, uid in enumerate(org_user_ids)])
+        org_ids = [row["organisation_id"] for row in cursor.execute("SELECT organisation_id FROM organisation")]
+
+        # Users for volunteers, then the volunteers with random ages and availability
+        cursor.executemany("INSERT INTO user (email, password_hash, role) VALUES (?, 'x', 'volunteer')",
+                           [(f"vol{i}@bench.test",) for i in range(volunteers)])
+        vol_user_ids = [row["user_id"] for row in cursor.execute("SELECT user_id FROM user WHERE role = 'volunteer' ORDER BY user_id")]
+        cursor.executemany("INSERT INTO volunteer (user_id, first_name, last_name, dob, availability) VALUES (?, ?, ?, ?, ?)",
+                           [(uid, f"First{i}", f"Last{i}", (today - timedelta(days=rng.randint(16 * 365, 70 * 365))).isoformat(),
+                             rng.choice(["Day", "Night"])) for i, uid in enumerate(vol_user_ids)])
+        vol_ids = [row["volunteer_id"] for row in cursor.execute("SELECT volunteer_id FROM volunteer")]
+
+        # Each volunteer gets 1-3 skills
+        cursor.executemany("INSERT INTO volunteer_skill (volunteer_id, skill_id) VALUES (?, ?)",
+                           [(v, s) for v in vol_ids for s in rng.sample(skill_ids, rng.randint(1, min(3, len(skill_ids))))])
+
+        # Events, with some share of them in the past
+        event_rows = []
+        for i in range(events):
+            offset = -rng.randint(1, 1000) if rng.random() < past_fraction else rng.randint(1, 365)
+            event_rows.append((rng.choice(org_ids), f"Event {i}", "Benchmark event " * 10,
+                               (today + timedelta(days=offset)).isoformat(), "Somewhere", rng.randint(5, 50)))
+        cursor.executemany("INSERT INTO event (organisation_id, title, description, event_date, location, max_volunteers) VALUES (?, ?, ?, ?, ?, ?)",
+                           event_rows)
+        event_ids = [row["event_id"] for row in cursor.execute("SELECT event_id FROM event")]
+
+        # Each event needs 1-3 skills
+        cursor.executemany("INSERT INTO event_skill (event_id, skill_id) VALUES (?, ?)",
+                           [(e, s) for e in event_ids for s in rng.sample(skill_ids, rng.randint(1, min(3, len(skill_ids))))])
+
+        # Requests and accepted attendees
+        request_rows, attendee_rows = [], []
+        for e in event_ids:
+            for v in rng.sample(vol_ids, min(joins_per_event, len(vol_ids))):
+                status = rng.choice(["pending", "accepted", "declined"])
+                request_rows.append((v, e, status))
+                if status == "accepted":
+                    attendee_rows.append((v, e))
+        cursor.executemany("INSERT INTO event_request (volunteer_id, event_id, status) VALUES (?, ?, ?)", request_rows)
+        cursor.executemany("INSERT INTO volunteer_event (volunteer_id, event_id) VALUES (?, ?)", attendee_rows)
+    conn.close()
+
+    return {"volunteer_ids": vol_ids, "event_ids": event_ids, "organisation_ids": org_ids, "skill_ids": skill_ids}
+
+
+# Percentile helper for latency lists (Values in seconds, returns milliseconds)
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index] * 1000
@@ -0,0 +1,216 @@
+# Batch matching of volunteers to upcoming events
+# Loads skills and ages into NumPy arrays, scores every volunteer against every event a chunk of events at a time,
+# and keeps the top N candidates per event in the 'event_candidate' table for organisations to look at
+import time
+
+import click
+
+from models import app, connect_db, init_db
+from skills import on_skills_changed
+
+# NumPy is only needed by the matching job, so the website still runs without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TOP_N = 20 # Candidates kept per event
+AGE_WEIGHT = 0.2 # How much being close to the event's average attendee age counts, next to skill coverage (Max 1.0)
+AGE_SPREAD = 40.0 # Age difference (Years) at which the age part of the score reaches zero
+CHUNK_BYTES = 64 * 1024 * 1024 # Size of one chunk's score matrix (Peak memory is a few of these, for the temporaries)
+
+
+# Everything the scorer needs, pulled out of the database as arrays
+def load_matching_data(conn):
+    cursor = conn.cursor()
+
+    # Map skill ids onto columns 0..K-1
+    skill_ids = [row['skill_id'] for row in cursor.execute("SELECT skill_id FROM skill ORDER BY skill_id")]
+    skill_col = {skill_id: i for i, skill_id in enumerate(skill_ids)}
+
+    # Volunteers and their ages
+    cursor.execute("SELECT volunteer_id, (julianday('now') - julianday(dob)) / 365 AS age FROM volunteer ORDER BY volunteer_id")
+    volunteers = cursor.fetchall()
+    volunteer_ids = np.array([row['volunteer_id'] for row in volunteers], dtype=np.int64)
+    volunteer_ages = np.array([row['age'] if row['age'] is not None else np.nan for row in volunteers], dtype=np.float32)
+    volunteer_row = {v: i for i, v in enumerate(volunteer_ids.tolist())}
+
+    # Upcoming events, with the average age of whoever already joined (From the analytics table)
+    cursor.execute("""
+        SELECT e.event_id,
+               CASE WHEN s.dob_count > 0 THEN (julianday('now') - s.dob_julian_sum / s.dob_count) / 365 END AS avg_age
+        FROM event e
+        LEFT JOIN event_stats s ON e.event_id = s.event_id
+        WHERE e.event_date >= date('now')
+        ORDER BY e.event_id""")
+    events = cursor.fetchall()
+    event_ids = np.array([row['event_id'] for row in events], dtype=np.int64)
+    event_ages = np.array([row['avg_age'] if row['avg_age'] is not None else np.nan for row in events], dtype=np.float32)
+    event_row = {e: i for i, e in enumerate(event_ids.tolist())}
+
+    # Skill matrices, one row per volunteer / event and one column per skill
+    volunteer_skills = np.zeros((len(volunteer_ids), len(skill_ids)), dtype=np.float32)
+    for row in cursor.execute("SELECT volunteer_id, skill_id FROM volunteer_skill"):
+        if row['volunteer_id'] in volunteer_row and row['skill_id'] in skill_col:
+            volunteer_skills[volunteer_row[row['volunteer_id']], skill_col[row['skill_id']]] = 1
+
+    event_skills = np.zeros((len(event_ids), len(skill_ids)), dtype=np.float32)
+    for row in cursor.execute("SELECT event_id, skill_id FROM event_skill"):
+        if row['event_id'] in event_row and row['skill_id'] in skill_col:
+            event_skills[event_row[row['event_id']], skill_col[row['skill_id']]] = 1
+
+    # Volunteers who already asked to join an event aren't suggested for it again
+    excluded = [(event_row[row['event_id']], volunteer_row[row['volunteer_id']])
+                for row in cursor.execute("SELECT event_id, volunteer_id FROM event_request")
+                if row['event_id'] in event_row and row['volunteer_id'] in volunteer_row]
+    excluded = np.array(excluded, dtype=np.int64).reshape(-1, 2)
+
+    return {
+        "volunteer_ids": volunteer_ids,
+        "volunteer_ages": volunteer_ages,
+        "volunteer_skills": volunteer_skills,
+        "event_ids": event_ids,
+        "event_ages": event_ages,
+        "event_skills": event_skills,
+        "excluded": excluded,
+    }
+
+
+# Score every volunteer against every event, returning the top N per event as three flat arrays
+# (event row, volunteer row, score), sorted by event then best score first
+def top_candidates(volunteer_skills, volunteer_ages, event_skills, event_ages, excluded=None, top_n=TOP_N, chunk_bytes=CHUNK_BYTES):
+    n_volunteers = volunteer_skills.shape[0]
+    n_events = event_skills.shape[0]
+    top_n = min(top_n, n_volunteers)
+
+    if n_volunteers == 0 or n_events == 0 or top_n == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32)
+
+    # Events per chunk, so a chunk's (events x volunteers) float32 matrix stays under the memory limit
+    chunk = max(1, min(n_events, chunk_bytes // (4 * n_volunteers)))
+
+    # Excluded pairs sorted by event, so each chunk can slice its own out
+    if excluded is None:
+        excluded = np.empty((0, 2), dtype=np.int64)
+    excluded = excluded[np.argsort(excluded[:, 0], kind="stable")]
+    excluded_events = excluded[:, 0]
+
+    # Per-event scaling, as column vectors: skill coverage is overlap / skills needed, and the whole score is scaled back into 0..1
+    # Events with no attendees yet (Or unknown ages) get no age weight, so they just score on skills
+    skill_scale = (1 / np.maximum(event_skills.sum(axis=1), 1) / (1 + AGE_WEIGHT)).astype(np.float32)[:, None]
+    age_scale = np.where(np.isnan(event_ages), 0, AGE_WEIGHT / (1 + AGE_WEIGHT)).astype(np.float32)[:, None]
+    event_ages = np.nan_to_num(event_ages, nan=0.0).astype(np.float32)[:, None]
+    volunteer_ages = np.nan_to_num(volunteer_ages, nan=-1e6).astype(np.float32) # Unknown ages never count as close
+    volunteer_skills_t = np.ascontiguousarray(volunteer_skills.T, dtype=np.float32)
+
+    out_events, out_volunteers, out_scores = [], [], []
+
+    for start in range(0, n_events, chunk):
+        stop = min(start + chunk, n_events)
+
+        # One row per event, so every per-event step below works on contiguous memory
+        # Skill coverage: how many of the event's skills the volunteer has, over how many it needs
+        overlap = event_skills[start:stop].astype(np.float32) @ volunteer_skills_t # (events in chunk x volunteers)
+        no_match = overlap == 0 # Same rule as the join button: no shared skill, no match
+        scores = overlap
+        scores *= skill_scale[start:stop]
+
+        # Age fit: 1 when the volunteer is the same age as the event's current average, 0 at AGE_SPREAD years apart
+        # Done in place on one temporary to keep memory down
+        age_fit = np.subtract(volunteer_ages, event_ages[start:stop])
+        np.abs(age_fit, out=age_fit)
+        age_fit *= -1 / AGE_SPREAD
+        age_fit += 1
+        np.maximum(age_fit, 0, out=age_fit)
+        age_fit *= age_scale[start:stop]
+        scores += age_fit
+        del age_fit
+
+        np.copyto(scores, -np.inf, where=no_match)
+
+        # Knock out volunteers who already requested this event
+        lo, hi = np.searchsorted(excluded_events, [start, stop])
+        if hi > lo:
+            scores[excluded[lo:hi, 0] - start, excluded[lo:hi, 1]] = -np.inf
+
+        # Best N per row without sorting the whole row, then sort just those N
+        best = np.argpartition(scores, n_volunteers - top_n, axis=1)[:, n_volunteers - top_n:] # (events in chunk x top_n)
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+        # Flatten event by event, dropping the -inf filler for events with fewer than N matches
+        event_index = np.broadcast_to(np.arange(start, stop)[:, None], best.shape)
+        keep = np.isfinite(best_scores)
+        out_events.append(event_index[keep])
+        out_volunteers.append(best[keep])
+        out_scores.append(best_scores[keep])
+
+    return np.concatenate(out_events), np.concatenate(out_volunteers), np.concatenate(out_scores).astype(np.float32)
+
+
+# Replace the stored candidates with a new set, in one transaction
+def store_candidates(conn, data, event_index, volunteer_index, scores):
+    event_ids = data["event_ids"][event_index].tolist()
+    volunteer_ids = data["volunteer_ids"][volunteer_index].tolist()
+
+    # Rank within each event (Rows come grouped by event, best first)
+    ranks = []
+    previous = None
+    for event_id in event_ids:
+        rank = rank + 1 if event_id == previous else 1
+        ranks.append(rank)
+        previous = event_id
+
+    computed_at = time.time()
+    with conn:
+        conn.execute("DELETE FROM event_candidate")
+        conn.executemany("""
+            INSERT INTO event_candidate (event_id, rank, volunteer_id, score, computed_at)
+            VALUES (?, ?, ?, ?, ?)""",
+            zip(event_ids, ranks, volunteer_ids, [round(float(s), 4) for s in scores], [computed_at] * len(event_ids)))
+
+
+# Drop suggestions a skill change has made wrong, the next matching run fills them back in
+@on_skills_changed
+def drop_stale_candidates(conn, change):
+    if change.owner == "event":
+        # Every score for the event depended on its skills
+        conn.execute("DELETE FROM event_candidate WHERE event_id = ?", (change.owner_id,))
+    elif change.removed:
+        # The volunteer may no longer share a skill with events they were suggested for
+        conn.execute("""
+            DELETE FROM event_candidate
+            WHERE volunteer_id = ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM event_skill es
+                  JOIN volunteer_skill vs ON es.skill_id = vs.skill_id
+                  WHERE es.event_id = event_candidate.event_id AND vs.volunteer_id = event_candidate.volunteer_id)""",
+            (change.owner_id,))
+
+
+# Load, score and store in one go, returns how many candidate rows were written
+def run_matching(conn, top_n=TOP_N):
+    data = load_matching_data(conn)
+    event_index, volunteer_index, scores = top_candidates(
+        data["volunteer_skills"], data["volunteer_ages"], data["event_skills"], data["event_ages"],
+        excluded=data["excluded"], top_n=top_n)
+    store_candidates(conn, data, event_index, volunteer_index, scores)
+    return len(scores)
+
+
+# Command to refresh the candidate lists: 'flask --app app match-volunteers [--top 20]'
+@app.cli.command("match-volunteers")
+@click.option("--top", default=TOP_N, show_default=True, help="Candidates to keep per event.")
+def match_volunteers_command(top):
+    if np is None:
+        raise click.ClickException("NumPy is needed for matching, install it with 'pip install numpy'.")
+
+    init_db() # Make sure the tables exist on a database that hasn't been started yet
+    started = time.perf_counter()
+    conn = connect_db()
+    written = run_matching(conn, top_n=top)
+    conn.close()
+    click.echo(f"Stored {written} candidates in {time.perf_counter() - started:.2f}s.")
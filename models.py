@@ -1,7 +1,11 @@
 # ALL IMPORTS
 import sqlite3
 import os
-from flask import Flask
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from flask import Flask, g, has_app_context, session
 
 # DATABASE = 'database.db', kept creating it in outer file if you run the code in outer directory
 base_dir = os.path.abspath(os.path.dirname(__file__)) # So defines the directory
@@ -11,17 +15,219 @@ db_path = os.path.join(base_dir, "database.db")
 app = Flask(__name__)
 app.secret_key = "berkay"  # Secret key (Don't really know why)
 
-# Get DB connection
-def get_db():
-    conn = sqlite3.connect(db_path) # Create connection between database and flask
+# Read/write split settings
+# READ_MODE "ro" reads the live file through read-only connections, "snapshot" reads a copy refreshed with the backup API
+READ_MODE = os.environ.get("CC_READ_MODE", "ro")
+READ_POOL_SIZE = 8 # Max number of read-only connections kept open
+SNAPSHOT_PATH = os.path.join(base_dir, "database.snapshot.db") # Where the read snapshot is written
+SNAPSHOT_INTERVAL = 5.0 # Seconds between snapshot refreshes
+
+MAX_SKILLS = 3 # Most skills a volunteer can have or an event can need (Enforced by triggers, see init_db)
+
+# Open a raw connection to the database (No pooling, used by init_db and scripts)
+def connect_db(path=None):
+    conn = sqlite3.connect(path or db_path, timeout=10) # Create connection between database and flask
     conn.row_factory = sqlite3.Row # Allows fetching rows as dictionaries
-    return conn 
+    return conn
+
+
+# Pool of read-only connections, so read routes never open the database for writing
+class ReadPool:
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.idle = queue.LifoQueue(maxsize=size) # LIFO so the warmest connection is reused first
+        self.closed = False
+
+    # Take a connection out of the pool, or open a new 'mode=ro' one if none are idle
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=10, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            return conn
+
+    # Give a connection back, closing it if the pool is already full
+    def release(self, conn):
+        if self.closed:
+            conn.close()
+            return
+        conn.rollback() # End any read transaction so the connection sees the newest data next time
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    # Close every idle connection, and any handed back later (Used when the snapshot file is replaced)
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+# Single writer connection, every write goes through here one transaction at a time
+class Writer:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock() # Serialises writers across threads
+        self.conn = None
+        self.depth = 0 # How many transaction() blocks the lock holder is inside (Only the holder touches it)
+
+    def connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            self.conn.execute("PRAGMA journal_mode=WAL") # WAL lets readers keep reading while the writer commits
+            self.conn.execute("PRAGMA synchronous=NORMAL") # Safe with WAL, and skips an fsync on every commit
+        return self.conn
+
+    # One write transaction: holds the lock only for the 'with' block, commits at the end or rolls back on an error
+    # Nested blocks (e.g. revoke_user_sessions inside my_account) join the outer transaction
+    @contextmanager
+    def transaction(self):
+        self.lock.acquire()
+        try:
+            conn = self.connect()
+            self.depth += 1
+            try:
+                yield conn
+                if self.depth == 1:
+                    conn.commit()
+            except BaseException:
+                if self.depth == 1:
+                    conn.rollback()
+                raise
+            finally:
+                self.depth -= 1
+        finally:
+            self.lock.release() # Always released, even if connecting failed
+
+
+# Read-only copy of the database, refreshed with the SQLite backup API from a background thread
+class Snapshot:
+    def __init__(self, source, path, interval):
+        self.source = source
+        self.path = path
+        self.interval = interval
+        self.taken_at = 0.0 # Time the current snapshot was finished
+        self.lock = threading.Lock()
+        self.pool = ReadPool(path, READ_POOL_SIZE)
+        self.thread = None
+
+    # Start refreshing in the background (Once per process, on the first snapshot read)
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            for leftover in (self.path + "-wal", self.path + "-shm"): # From older copies left in WAL mode
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            self.thread = threading.Thread(target=self.run, name="snapshot-refresh", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                self.refresh()
+            except sqlite3.Error as e:
+                app.logger.warning("Snapshot refresh failed: %s", e) # Reads fall back to the live file until one works
+            time.sleep(self.interval)
+
+    # Copy the live database into the snapshot file (Requests never wait on this, they keep reading the old copy)
+    def refresh(self):
+        started = time.time()
+        tmp_path = self.path + ".tmp"
+        src = sqlite3.connect(self.source, timeout=10)
+        dst = sqlite3.connect(tmp_path)
+        try:
+            src.backup(dst) # Online copy, doesn't block the writer
+            dst.execute("PRAGMA journal_mode=DELETE") # Single self-contained file, so no -wal/-shm is left behind for open readers
+        finally:
+            dst.close()
+            src.close()
+
+        # Swap in the new file in one step, with a fresh pool for it
+        # Readers still on the old file keep it open until they finish, then their pool closes them
+        os.replace(tmp_path, self.path)
+        old_pool, self.pool = self.pool, ReadPool(self.path, READ_POOL_SIZE)
+        old_pool.close()
+        self.taken_at = started # Anything committed after this point may be missing from the copy
+
+
+read_pool = ReadPool(db_path, READ_POOL_SIZE)
+writer = Writer(db_path)
+snapshot = Snapshot(db_path, SNAPSHOT_PATH, SNAPSHOT_INTERVAL)
+
+
+# Get DB connection for writing, use as 'with get_db() as conn:'
+# The single writer is only held for the 'with' block, so do slow work (Like password hashing) before it
+def get_db():
+    # Outside of a request (Scripts, shell), just hand back a plain connection
+    if not has_app_context():
+        return connect_db()
+    return request_write()
+
+
+# The writer's transaction, noting on 'g' if this request actually wrote anything
+@contextmanager
+def request_write():
+    with writer.transaction() as conn:
+        changes_start = conn.total_changes
+        try:
+            yield conn
+        finally:
+            if conn.total_changes != changes_start:
+                g.wrote = True
+
+
+# Get DB connection for read-only routes
+def get_read_db():
+    # Outside of a request (Scripts, shell), just hand back a plain connection
+    if not has_app_context():
+        return connect_db()
+
+    # This request wrote since it started reading a snapshot, switch to the live file so it sees its own changes
+    if "read_db" in g and g.get("wrote") and g.read_pool is not read_pool:
+        g.pop("read_pool").release(g.pop("read_db"))
+
+    if "read_db" not in g:
+        pool = read_pool
+        if READ_MODE == "snapshot":
+            snapshot.start()
+            # Read-your-writes: if this request or session wrote after the snapshot was taken, read the live file instead
+            if snapshot.taken_at and not g.get("wrote") and session.get("last_write", 0) < snapshot.taken_at:
+                pool = snapshot.pool
+        g.read_pool = pool
+        g.read_db = pool.acquire()
+    return g.read_db
+
+
+# Hand connections back at the end of every request
+@app.teardown_appcontext
+def release_db(exception):
+    read_db = g.pop("read_db", None)
+    if read_db is not None:
+        g.pop("read_pool").release(read_db)
+
+
+# Remember when this session last wrote, so its next reads don't come from an older snapshot
+@app.after_request
+def remember_write(response):
+    if g.get("wrote"):
+        session["last_write"] = time.time()
+    return response
 
 
 # Initialise DB with all tables
-def init_db():
-    with get_db() as conn:
+def init_db(path=None):
+    with connect_db(path) as conn:
         cursor = conn.cursor() # Initialising cursor object
+        cursor.execute("PRAGMA journal_mode=WAL") # Readers and the writer don't block each other in WAL mode
+        cursor.execute("BEGIN IMMEDIATE") # Every worker runs this at start up, so set up the schema in one transaction (Triggers are never missing halfway)
 
         # Creating the 'user' table
         cursor.execute('''
@@ -123,8 +329,109 @@ def init_db():
             UNIQUE(volunteer_id, event_id) -- prevent duplicate requests
         );''')
 
+        # Creating the 'user_session' table (Server-side sessions, the cookie only holds the token)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_session (
+            token TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            volunteer_id INTEGER, -- Resolved once at login
+            organisation_id INTEGER, -- Resolved once at login
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            revoked INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES user(user_id) ON DELETE CASCADE
+        );''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_session_user ON user_session (user_id)")
+
+        # Creating the 'event_candidate' table (Best volunteers for each upcoming event, filled by the matching job)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_candidate (
+            event_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL, -- 1 is the best match
+            volunteer_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            computed_at REAL NOT NULL,
+            PRIMARY KEY (event_id, rank),
+            FOREIGN KEY (event_id) REFERENCES event(event_id) ON DELETE CASCADE,
+            FOREIGN KEY (volunteer_id) REFERENCES volunteer(volunteer_id) ON DELETE CASCADE
+        );''')
+
+        # Index for finding old events to archive, and for looking up an event's attendees and requests
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_event_date ON event (event_date)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_volunteer_event_event ON volunteer_event (event_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_event_request_event ON event_request (event_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_event_candidate_volunteer ON event_candidate (volunteer_id)") # For dropping a volunteer's stale suggestions
+
+        # Skill limit, enforced by the database so no code path can go over it (Recreated so a new MAX_SKILLS applies)
+        for table, owner in (("volunteer_skill", "volunteer_id"), ("event_skill", "event_id")):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {table}_limit")
+            cursor.execute(f'''
+            CREATE TRIGGER {table}_limit BEFORE INSERT ON {table}
+            WHEN (SELECT COUNT(*) FROM {table} WHERE {owner} = NEW.{owner}) >= {MAX_SKILLS}
+            BEGIN
+                SELECT RAISE(ABORT, 'skill limit of {MAX_SKILLS} reached');
+            END;''')
+
+        # Archive tables, same columns as the live tables, completed events are moved here by the archive job (archive.py)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_archive (
+            event_id INTEGER PRIMARY KEY,
+            organisation_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT,
+            event_date TIMESTAMP NOT NULL,
+            location TEXT,
+            max_volunteers INTEGER,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (organisation_id) REFERENCES organisation(organisation_id) ON DELETE CASCADE
+        );''')
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS volunteer_event_archive (
+            volunteer_id INTEGER NOT NULL,
+            event_id INTEGER NOT NULL,
+            signup_date TIMESTAMP,
+            PRIMARY KEY (volunteer_id, event_id),
+            FOREIGN KEY (volunteer_id) REFERENCES volunteer(volunteer_id) ON DELETE CASCADE,
+            FOREIGN KEY (event_id) REFERENCES event_archive(event_id) ON DELETE CASCADE
+        );''')
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_skill_archive (
+            event_id INTEGER NOT NULL,
+            skill_id INTEGER NOT NULL,
+            PRIMARY KEY (event_id, skill_id),
+            FOREIGN KEY (event_id) REFERENCES event_archive(event_id) ON DELETE CASCADE,
+            FOREIGN KEY (skill_id) REFERENCES skill(skill_id) ON DELETE CASCADE
+        );''')
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_request_archive (
+            request_id INTEGER PRIMARY KEY,
+            volunteer_id INTEGER NOT NULL,
+            event_id INTEGER NOT NULL,
+            status TEXT,
+            FOREIGN KEY (volunteer_id) REFERENCES volunteer(volunteer_id) ON DELETE CASCADE,
+            FOREIGN KEY (event_id) REFERENCES event_archive(event_id) ON DELETE CASCADE
+        );''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_event_request_archive_event ON event_request_archive (event_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_volunteer_event_archive_event ON volunteer_event_archive (event_id)")
+
+        # Views over live + archived rows, for history and analytics
+        for table in ("event", "volunteer_event", "event_skill", "event_request"):
+            columns = "event_id, organisation_id, title, description, event_date, location, max_volunteers" if table == "event" else "*"
+            cursor.execute(f"CREATE VIEW IF NOT EXISTS all_{table} AS SELECT {columns} FROM {table} UNION ALL SELECT {columns} FROM {table}_archive")
+
+        # Flags for maintenance jobs (e.g. 'archiving'), so triggers can tell a move from a real delete
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_flag (
+            name TEXT PRIMARY KEY
+        );''')
+
 
     # Add skills into skill table, 'INSERT OR IGNORE' is like 'CREATE IF NOT EXISTS'
+    cursor.execute("BEGIN IMMEDIATE") # Same again for the analytics triggers, the 'with' above committed the schema
     cursor.executemany('''
     INSERT OR IGNORE INTO skill (name, description) VALUES (?, ?)
     ''', [
@@ -134,5 +441,9 @@ def init_db():
         ("Public Speaking", "Confident in speaking to groups")
     ])
 
+    # Summary tables and triggers for the insights page (Imported here as analytics needs the app from this file)
+    from analytics import init_analytics
+    init_analytics(conn)
+
     conn.commit() # Commit all changes
     #conn.close(), don't need as in 'with' command, which is pythonic way of automatically closing website
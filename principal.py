@@ -0,0 +1,155 @@
+# Server-side sessions and the logged-in "principal" (Who the user is, resolved once at login)
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from flask import g, request, session
+
+from models import app, get_db, get_read_db
+
+SESSION_LIFETIME = 60 * 60 * 24 * 7 # Sessions last a week
+CACHE_TTL = 30 # Seconds a cached session is trusted before re-checking the table (So revocations from other workers show up)
+CACHE_MAX = 10000 # Max number of sessions kept in memory
+SESSIONLESS_ENDPOINTS = {'static'} # Never look at the session here, so responses stay cacheable (No 'Vary: Cookie')
+
+
+# Everything handlers need to know about the logged-in user
+@dataclass(frozen=True)
+class Principal:
+    token: str
+    user_id: int
+    role: str
+    volunteer_id: Optional[int] = None
+    organisation_id: Optional[int] = None
+    expires_at: float = 0.0
+
+    @property
+    def is_volunteer(self):
+        return self.role == "volunteer" and self.volunteer_id is not None
+
+    @property
+    def is_organisation(self):
+        return self.role == "organisation" and self.organisation_id is not None
+
+
+# In-memory cache of token -> (principal, time it was checked), so most requests don't touch the database
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cache_put(principal):
+    with _cache_lock:
+        # Keep the cache bounded, drop expired entries first, and everything if that isn't enough
+        if len(_cache) >= CACHE_MAX:
+            now = time.time()
+            for token in [t for t, (p, _) in _cache.items() if p.expires_at < now]:
+                del _cache[token]
+            if len(_cache) >= CACHE_MAX:
+                _cache.clear()
+        _cache[principal.token] = (principal, time.time())
+
+
+def _cache_drop(token):
+    with _cache_lock:
+        _cache.pop(token, None)
+
+
+# Create a server-side session for a user row (Needs user_id, role, volunteer_id, organisation_id)
+def start_session(user):
+    now = time.time()
+    principal = Principal(
+        token=secrets.token_urlsafe(32),
+        user_id=user['user_id'],
+        role=user['role'],
+        volunteer_id=user['volunteer_id'],
+        organisation_id=user['organisation_id'],
+        expires_at=now + SESSION_LIFETIME,
+    )
+
+    with get_db() as conn:
+        conn.execute("DELETE FROM user_session WHERE expires_at < ?", (now,)) # Clean out expired sessions while we're writing anyway
+        conn.execute("""
+            INSERT INTO user_session (token, user_id, role, volunteer_id, organisation_id, created_at, expires_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (principal.token, principal.user_id, principal.role, principal.volunteer_id, principal.organisation_id, now, principal.expires_at))
+
+    _cache_put(principal)
+
+    # Cookie keeps the token, plus user_id and role for the templates
+    session['loggedin'] = True
+    session['token'] = principal.token
+    session['user_id'] = principal.user_id
+    session['role'] = principal.role
+    return principal
+
+
+# Revoke the current session (Logout)
+def end_session():
+    token = session.get('token')
+    if token:
+        with get_db() as conn:
+            conn.execute("UPDATE user_session SET revoked = 1 WHERE token = ?", (token,))
+        _cache_drop(token)
+    session.clear()
+
+
+# Revoke every session of a user (e.g. after a password change)
+def revoke_user_sessions(user_id, keep_token=None):
+    with get_db() as conn:
+        conn.execute("UPDATE user_session SET revoked = 1 WHERE user_id = ? AND token IS NOT ?", (user_id, keep_token))
+    with _cache_lock:
+        for token in [t for t, (p, _) in _cache.items() if p.user_id == user_id and t != keep_token]:
+            del _cache[token]
+
+
+# Look a token up, from the cache if it was checked recently, otherwise from the table
+def load_principal(token):
+    now = time.time()
+
+    cached = _cache.get(token)
+    if cached:
+        principal, checked_at = cached
+        if principal.expires_at < now:
+            _cache_drop(token)
+            return None
+        if now - checked_at < CACHE_TTL:
+            return principal
+
+    cursor = get_read_db().cursor()
+    cursor.execute("""
+        SELECT token, user_id, role, volunteer_id, organisation_id, expires_at
+        FROM user_session
+        WHERE token = ? AND revoked = 0 AND expires_at > ?""", (token, now))
+    row = cursor.fetchone()
+
+    if not row:
+        _cache_drop(token)
+        return None
+
+    principal = Principal(**dict(row))
+    _cache_put(principal)
+    return principal
+
+
+# The principal for this request, or None if not logged in
+def current_principal():
+    return g.get('principal')
+
+
+# Resolve the principal before every request, and log out cookies whose session was revoked or expired
+@app.before_request
+def resolve_principal():
+    g.principal = None
+    if request.endpoint in SESSIONLESS_ENDPOINTS:
+        return
+
+    token = session.get('token')
+
+    if token:
+        g.principal = load_principal(token)
+
+    # Stale cookie (Revoked, expired, or from before server-side sessions), so clear it
+    if g.principal is None and 'user_id' in session:
+        session.clear()
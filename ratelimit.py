@@ -0,0 +1,197 @@
+# Rate limiting for login, register and join_event
+# Token buckets per IP, per account and per route, checked before anything else in the request runs,
+# so a burst of bad logins or bot joins is turned away before any password hashing or database work
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from flask import jsonify, render_template, request, session
+
+from models import app, base_dir
+
+RATE_LIMIT_BACKEND = os.environ.get("CC_RATE_LIMIT_BACKEND", "memory") # "memory" per process, "sqlite" shared by every worker on the host
+RATE_LIMIT_DB = os.path.join(base_dir, "ratelimit.db") # Used by the "sqlite" backend
+EVICT_INTERVAL = 60 # Seconds between sweeps of idle buckets
+
+
+# A limit: 'burst' requests straight away, then 'per_minute' a minute after that
+# With failures_only, requests are only turned away once the bucket is empty, and only record_failure() empties it
+# (So someone who knows an email address can't lock its owner out just by sending requests)
+class Limit:
+    def __init__(self, name, per_minute, burst, key, failures_only=False):
+        self.name = name
+        self.rate = per_minute / 60 # Tokens added per second
+        self.burst = burst
+        self.key = key # Function returning what to count by (IP, email, user id), or None to skip
+        self.failures_only = failures_only
+
+
+# What each route is limited by (POST only, GETs just show the form)
+def client_ip():
+    return request.remote_addr or "unknown"
+
+
+def login_email():
+    return request.form.get('email', '').strip().lower() or None
+
+
+def session_user():
+    return session.get('user_id') # From the signed cookie, no database lookup
+
+
+LIMITS = {
+    'login': [
+        Limit("login:ip", per_minute=20, burst=10, key=client_ip),
+        Limit("login:account", per_minute=5, burst=5, key=login_email, failures_only=True), # Slows down guessing one account's password from many IPs
+    ],
+    'register': [
+        Limit("register:ip", per_minute=2, burst=5, key=client_ip),
+    ],
+    'join_event': [
+        Limit("join_event:ip", per_minute=60, burst=30, key=client_ip),
+        Limit("join_event:account", per_minute=20, burst=10, key=session_user),
+    ],
+}
+
+
+# In-process buckets: key -> [tokens, last update, time the bucket is full again]
+class MemoryBuckets:
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.last_sweep = time.monotonic()
+
+    # Take a token if there is one, returns seconds to wait (0 if allowed)
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                tokens = burst
+            else:
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate) # Refill for the time since last seen
+
+            if tokens < 1:
+                return (1 - tokens) / rate
+
+            tokens -= 1
+            self.buckets[key] = [tokens, now, now + (burst - tokens) / rate]
+
+            if now - self.last_sweep > EVICT_INTERVAL:
+                self.sweep(now)
+            return 0
+
+    # Seconds to wait before a token is available, without taking it
+    def peek(self, key, rate, burst):
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                return 0
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            return 0 if tokens >= 1 else (1 - tokens) / rate
+
+    # Drop buckets that have refilled completely, they're the same as no bucket at all
+    def sweep(self, now):
+        for key in [k for k, b in self.buckets.items() if b[2] <= now]:
+            del self.buckets[key]
+        self.last_sweep = now
+
+
+# Buckets in a small SQLite file, so every worker process on the host shares them
+class SQLiteBuckets:
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local() # One connection per thread
+        self.last_sweep = time.time()
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None) # Autocommit, each take() is one statement
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF") # Losing a few counts in a crash doesn't matter
+            conn.execute("CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)")
+            self.local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        conn = self.connection()
+
+        # Refill and take a token in one statement, no row comes back if the bucket is empty
+        row = conn.execute("""
+            INSERT INTO bucket (key, tokens, updated_at) VALUES (?, ? - 1, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                tokens = MIN(?, tokens + (excluded.updated_at - updated_at) * ?) - 1,
+                updated_at = excluded.updated_at
+            WHERE MIN(?, tokens + (excluded.updated_at - updated_at) * ?) >= 1
+            RETURNING tokens""", (key, burst, now, burst, rate, burst, rate)).fetchone()
+
+        if now - self.last_sweep > EVICT_INTERVAL:
+            conn.execute("DELETE FROM bucket WHERE updated_at < ?", (now - 3600,)) # Every limit here refills within an hour
+            self.last_sweep = now
+
+        if row is not None:
+            return 0
+        return self.peek(key, rate, burst) or 0.001
+
+    def peek(self, key, rate, burst):
+        row = self.connection().execute("SELECT MIN(?, tokens + (? - updated_at) * ?) FROM bucket WHERE key = ?",
+                                        (burst, time.time(), rate, key)).fetchone()
+        if row is None or row[0] >= 1:
+            return 0
+        return (1 - row[0]) / rate
+
+
+buckets = SQLiteBuckets(RATE_LIMIT_DB) if RATE_LIMIT_BACKEND == "sqlite" else MemoryBuckets()
+limited_counts = Counter() # Limit name -> requests turned away (This process only)
+
+
+# Runs before every other request hook
+def check_rate_limits():
+    if request.method != 'POST':
+        return None
+
+    for limit in LIMITS.get(request.endpoint, []):
+        value = limit.key()
+        if value is None:
+            continue
+
+        key = f"{limit.name}:{value}"
+        wait = buckets.peek(key, limit.rate, limit.burst) if limit.failures_only else buckets.take(key, limit.rate, limit.burst)
+        if wait:
+            limited_counts[limit.name] += 1
+            retry_after = max(1, math.ceil(wait))
+            return render_template("too_many_requests.html", retry_after=retry_after), 429, {"Retry-After": str(retry_after)}
+
+    return None
+
+
+# Charge the failures_only limits of the current route, called by the route when an attempt fails (e.g. a wrong password)
+def record_failure():
+    for limit in LIMITS.get(request.endpoint, []):
+        if limit.failures_only:
+            value = limit.key()
+            if value is not None:
+                buckets.take(f"{limit.name}:{value}", limit.rate, limit.burst)
+
+
+# Put the check at the front of the queue, ahead of the session lookup in principal.py
+app.before_request_funcs.setdefault(None, []).insert(0, check_rate_limits)
+
+
+# Counters of limited requests, only answered for requests from the server itself
+@app.route('/rate-limits')
+def rate_limit_stats():
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        return "Not found", 404
+
+    return jsonify({
+        "backend": RATE_LIMIT_BACKEND,
+        "limited": dict(limited_counts),
+        "buckets": len(buckets.buckets) if isinstance(buckets, MemoryBuckets) else None,
+    })
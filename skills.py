@@ -0,0 +1,94 @@
+# Skill assignment for volunteers and events
+# Works out which skills were added and removed compared to what's stored, and writes only those rows
+# (executemany, one transaction), so unchanged skills don't churn the indexes or the analytics triggers.
+# Every real change is passed to the listeners registered with on_skills_changed(), e.g. matching.py
+from dataclasses import dataclass
+from sqlite3 import IntegrityError
+
+from models import MAX_SKILLS
+
+# Owner -> (junction table, id column)
+OWNERS = {
+    "volunteer": ("volunteer_skill", "volunteer_id"),
+    "event": ("event_skill", "event_id"),
+}
+
+_listeners = [] # Functions called with (conn, change) for every change
+
+
+# Raised when the chosen skills aren't allowed (Too many, or not in the skill table), message is shown to the user
+class SkillError(ValueError):
+    pass
+
+
+# What changed for one volunteer or event
+@dataclass(frozen=True)
+class SkillChange:
+    owner: str # "volunteer" or "event"
+    owner_id: int
+    added: frozenset
+    removed: frozenset
+
+
+# Register a listener: '@on_skills_changed' on a function taking (conn, change)
+# Listeners run inside the same transaction as the change, so anything they write commits or rolls back with it
+def on_skills_changed(listener):
+    _listeners.append(listener)
+    return listener
+
+
+# Turn submitted skill ids (Strings from a form) into a set of ids that exist, or raise SkillError
+def validate_skills(conn, skill_ids):
+    try:
+        wanted = {int(s) for s in skill_ids}
+    except (TypeError, ValueError):
+        raise SkillError("Unknown skill selected.")
+
+    if len(wanted) > MAX_SKILLS:
+        raise SkillError(f"You can only select up to {MAX_SKILLS} skills.")
+
+    if wanted:
+        placeholders = ",".join("?" * len(wanted))
+        known = {row[0] for row in conn.execute(f"SELECT skill_id FROM skill WHERE skill_id IN ({placeholders})", list(wanted))}
+        if known != wanted:
+            raise SkillError("Unknown skill selected.")
+
+    return wanted
+
+
+# Set the skills of a volunteer or event to exactly 'skill_ids', returns the SkillChange (None if nothing changed)
+# Commits on success, rolls back everything since the last commit on failure (So an event being created with bad skills isn't kept)
+def assign_skills(conn, owner, owner_id, skill_ids):
+    table, column = OWNERS[owner]
+
+    with conn:
+        wanted = validate_skills(conn, skill_ids)
+        current = {row[0] for row in conn.execute(f"SELECT skill_id FROM {table} WHERE {column} = ?", (owner_id,))}
+
+        added = wanted - current
+        removed = current - wanted
+        if not added and not removed:
+            return None
+
+        # Removals first, so swapping a skill never goes over the limit
+        try:
+            conn.executemany(f"DELETE FROM {table} WHERE {column} = ? AND skill_id = ?", [(owner_id, s) for s in removed])
+            conn.executemany(f"INSERT INTO {table} ({column}, skill_id) VALUES (?, ?)", [(owner_id, s) for s in added])
+        except IntegrityError as e:
+            if "skill limit" not in str(e):
+                raise
+            raise SkillError(f"You can only select up to {MAX_SKILLS} skills.") # The limit trigger caught it (e.g. a concurrent update)
+
+        change = SkillChange(owner, owner_id, frozenset(added), frozenset(removed))
+        for listener in _listeners:
+            listener(conn, change)
+
+    return change
+
+
+def set_volunteer_skills(conn, volunteer_id, skill_ids):
+    return assign_skills(conn, "volunteer", volunteer_id, skill_ids)
+
+
+def set_event_skills(conn, event_id, skill_ids):
+    return assign_skills(conn, "event", event_id, skill_ids)